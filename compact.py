@@ -0,0 +1,152 @@
+#!/usr/bin/python3
+"""Compaction of closed Datasink partitions into daily columnar files."""
+
+import os
+import logging
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+import pandas as pd
+
+from datasink import Datasink, DatasetReader
+
+
+# Columns tried in order to sort records by time
+_TIME_KEYS = ('microtimestamp', 'timestamp', 'time')
+
+
+def _daypath(dest, day):
+    return os.path.join(dest, day.strftime('%Y/%m/%d.parquet'))
+
+
+def compact_day(root, dest, day, force=False, **options):
+    """Compact every file of a day into one sorted, deduplicated Parquet file.
+
+    The output is written to a temporary file and atomically renamed into
+    place, so readers never see a partial file. A day whose output is newer
+    than all of its inputs is skipped, which makes repeated runs idempotent.
+
+    Args
+    ----
+    root : str
+        Dataset root written by Datasink
+    dest : str
+        Root of the compacted dataset, laid out as dest/YYYY/MM/DD.parquet
+    day : datetime
+        Start of the day to compact
+    force : bool
+        Rewrite the output even if it is up to date
+    **options
+        ext, resolution, namemode, sequenced and header of the dataset, plus
+        names to override column names and key to sort by
+
+    Returns
+    -------
+    int
+        Number of rows written, or None when the day was skipped
+
+    """
+    names = options.pop('names', None)
+    key   = options.pop('key', None)
+
+    reader = DatasetReader(root, day, day + timedelta(days=1), **options)
+    files  = list(reader.files())
+    if not files:
+        logging.info('{}: no files'.format(day.date()))
+        return None
+
+    out = _daypath(dest, day)
+    if not force and os.path.exists(out):
+        newest = max(os.path.getmtime(f) for f in files)
+        if os.path.getmtime(out) >= newest:
+            logging.info('{}: up to date'.format(day.date()))
+            return None
+
+    kwargs = {'names': names} if names else {}
+    data = pd.concat(reader.chunks(**kwargs), ignore_index=True)
+
+    if key is None:
+        key = next((k for k in _TIME_KEYS if k in data.columns), None)
+    if key is not None:
+        data = data.sort_values(key, kind='mergesort')
+    data = data.drop_duplicates(ignore_index=True)
+
+    os.makedirs(os.path.dirname(out), mode=0o775, exist_ok=True)
+    tmp = '{}.{}.tmp'.format(out, os.getpid())
+    data.to_parquet(tmp, compression='zstd', index=False)
+    os.replace(tmp, out)
+
+    logging.info('{}: {} files into {} rows'.format(day.date(), len(files), len(data)))
+    return len(data)
+
+
+def closed_days(start, end, grace=timedelta(minutes=5)):
+    """Yield the days in [start, end) that finished at least grace ago."""
+    horizon = datetime.now() - grace
+    day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    while day < end and day + timedelta(days=1) <= horizon:
+        yield day
+        day += timedelta(days=1)
+
+
+@click.command()
+@click.argument('root')
+@click.option('-d', '--dest', default=None,
+    help='Root of the compacted dataset, defaults to ROOT-daily'
+)
+@click.option('--start', type=click.DateTime(['%Y-%m-%d']), required=True,
+    help='First day to compact'
+)
+@click.option('--end', type=click.DateTime(['%Y-%m-%d']), default=None,
+    help='Day to stop before, defaults to today'
+)
+@click.option('--ext', default='csv', show_default=True, help='File extension of the dataset')
+@click.option('--resolution', default=Datasink.MINUTE, show_default=True,
+    help='Resolution the dataset was written with'
+)
+@click.option('--namemode', default=2, show_default=True, help='Naming mode of the dataset')
+@click.option('--sequenced', is_flag=True, help='Dataset uses size based rotation')
+@click.option('--header/--no-header', default=True, show_default=True,
+    help='Files start with a header line'
+)
+@click.option('--names', default=None, help='Comma separated column names to use')
+@click.option('--key', default=None, help='Column to sort by, inferred if not provided')
+@click.option('-j', '--jobs', default=os.cpu_count(), show_default=True,
+    help='Number of days to compact in parallel'
+)
+@click.option('--force', is_flag=True, help='Rewrite days that are up to date')
+def main(root, dest, start, end, ext, resolution, namemode, sequenced, header, names, key,
+         jobs, force):
+    """Compact closed partitions of a Datasink dataset into daily Parquet files.
+
+    Only days that have finished are compacted, so it is safe to run while
+    collection continues. Input files are never modified.
+    """
+    logging.basicConfig(level=logging.INFO)
+
+    dest = dest or root.rstrip('/') + '-daily'
+    end  = end or datetime.now()
+    days = list(closed_days(start, end))
+
+    options = dict(
+        ext=ext,
+        resolution=resolution,
+        namemode=namemode,
+        sequenced=sequenced,
+        header=header,
+        names=names.split(',') if names else None,
+        key=key,
+    )
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(compact_day, root, dest, day, force, **options) for day in days]
+        for day, future in zip(days, futures):
+            try:
+                future.result()
+            except Exception:
+                logging.exception('{}: compaction failed'.format(day.date()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,27 @@
 #!/usr/bin/python3
 """Conversion routines between various types of financial market data."""
 
+import os
 import sys
+import json
+import time
+import hashlib
 import logging
 import traceback
+import contextlib
+import multiprocessing
+from bisect import bisect_left, insort
+from functools import partial
+from itertools import repeat
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 
 import click
 import numpy as np
 import pandas as pd
 
+from datasink import Datasink, DatasetReader
+
 
 def _round_down_nearest(n, precision: int):
     return (n // precision) * precision
@@ -18,89 +31,1169 @@ def _round_down_nearest(n, precision: int):
 # | Input routines |
 # ------------------
 
-def tick_from_csv(file, **kwargs):
+# Leading bytes of compressed streams
+_MAGIC = {
+        b'\x1f\x8b': 'gzip',
+        b'\x28\xb5\x2f\xfd': 'zstd',
+}
+
+
+def _decompressed(file):
+    """Return the input and the compression pandas should read it with.
+
+    Paths are left to pandas to infer from the extension. Streams such as
+    stdin are sniffed for a compression magic number.
+    """
+    if isinstance(file, str):
+        return file, 'infer'
+
+    buf = getattr(file, 'buffer', file)
+    if hasattr(buf, 'peek'):
+        head = buf.peek(4)[:4]
+        for magic, codec in _MAGIC.items():
+            if head.startswith(magic):
+                return buf, codec
+    return file, None
+
+
+# Column types of each data type. Prices and amounts stay float64 for their
+# precision, enums are small ints or categoricals with fixed categories so
+# that chunks concatenate without falling back to object columns.
+TICK_DTYPES = {
+        'id': 'int64',
+        'price': 'float64',
+        'amount': 'float64',
+        'timestamp': 'int64',
+        'microtimestamp': 'int64',
+        'type': 'int8',
+}
+
+DIFF_DTYPES = {
+        'id': 'int64',
+        'price': 'float64',
+        'amount': 'float64',
+        'order_type': 'int8',
+        'diff_type': pd.CategoricalDtype(['create', 'delete', 'take']),
+        'microtimestamp': 'int64',
+}
+
+# Column names used by collectors for canonical columns
+_ALIASES = {
+        'time': 'timestamp',
+}
+
+
+def _typed(data: pd.DataFrame, dtypes: dict, usecols=None) -> pd.DataFrame:
+    """Rename aliased columns, project them to usecols and cast to dtypes."""
+    data = data.rename(columns=_ALIASES)
+    if usecols:
+        data = data[[c for c in usecols if c in data.columns]]
+    casts = {c: t for c, t in dtypes.items() if c in data.columns and data[c].dtype != t}
+    return data.astype(casts) if casts else data
+
+
+def _typed_chunks(data, dtypes: dict, usecols=None):
+    if isinstance(data, pd.DataFrame):
+        return _typed(data, dtypes, usecols)
+    return (_typed(chunk, dtypes, usecols) for chunk in data)
+
+
+def _read_typed_csv(file, dtypes, chunksize=None, usecols=None, **kwargs):
+    """Read CSV with explicit column types, parsing only the usecols columns.
+
+    usecols is a comma separated list of canonical column names.
+    """
+    dtype = dict(dtypes)
+    dtype.update({alias: dtypes[name] for alias, name in _ALIASES.items() if name in dtypes})
+
+    columns = None
+    if usecols:
+        wanted  = set(usecols.split(','))
+        columns = lambda c: _ALIASES.get(c, c) in wanted
+
+    file, compression = _decompressed(file)
+    data = pd.read_csv(
+        file,
+        dtype=dtype,
+        usecols=columns,
+        chunksize=chunksize,
+        compression=compression,
+        **kwargs
+    )
+    return _typed_chunks(data, dtypes)
+
+
+def _typed_reader(reader, dtypes):
+    """Wrap a columnar reader to cast its output to dtypes."""
+    def read(file, chunksize=None, usecols=None, **kwargs):
+        data = reader(file, chunksize=chunksize, usecols=usecols, **kwargs)
+        return _typed_chunks(data, dtypes)
+    return read
+
+
+def tick_from_csv(file, chunksize=None, usecols=None, **kwargs):
     header = None
     if 'header' in kwargs:
         header = kwargs['header'].split(',')
-    return pd.read_csv(file, names=header)
+    return _read_typed_csv(file, TICK_DTYPES, chunksize, usecols, names=header)
+
+
+def _json_loads():
+    """Return the fastest available JSON decoder."""
+    try:
+        import orjson
+        return orjson.loads
+    except ImportError:
+        return json.loads
+
+
+# Files smaller than this are parsed in the calling process
+_PARALLEL_JSON_BYTES = 2**26
+
+
+def _line_ranges(path, parts: int) -> list:
+    """Split a file into about parts byte ranges that start at line starts."""
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as f:
+        for i in range(1, parts):
+            f.seek(max(size * i // parts, bounds[-1]))
+            f.readline()
+            bounds.append(f.tell())
+    bounds.append(size)
+    return [(lo, hi) for lo, hi in zip(bounds, bounds[1:]) if hi > lo]
+
+
+def _read_json_range(path, start, end) -> list:
+    loads = _json_loads()
+    with open(path, 'rb') as f:
+        f.seek(start)
+        lines = f.read(end - start).splitlines()
+    return [loads(line) for line in lines if line.strip()]
+
+
+def _parse_tick_range(path, start, end, usecols=None) -> pd.DataFrame:
+    # Columns are projected after aliasing, as usecols names canonical columns
+    data = pd.DataFrame.from_records(_read_json_range(path, start, end))
+    return _typed(data, TICK_DTYPES, usecols)
+
+
+def _parse_book_range(path, start, end, depth) -> pd.DataFrame:
+    return _snapshots_to_book(_read_json_range(path, start, end), depth)
+
+
+def _parallel_json(path, parse, *args, jobs=None) -> pd.DataFrame:
+    """Parse a JSON lines file in byte ranges, in parallel for large files.
+
+    Every range is decoded into a typed DataFrame by parse in a worker
+    process, so only compact column arrays are sent back and concatenated.
+    """
+    if jobs:
+        jobs = int(jobs)
+    elif multiprocessing.parent_process() is not None:
+        # Already a worker, e.g. of batch_data, which parallelizes over files
+        jobs = 1
+    else:
+        jobs = os.cpu_count()
+    size = os.path.getsize(path)
+    if size < _PARALLEL_JSON_BYTES or jobs == 1:
+        return parse(path, 0, size, *args)
 
+    # More ranges than workers even out lines of uneven length
+    ranges = _line_ranges(path, 4 * jobs)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(parse, path, lo, hi, *args) for lo, hi in ranges]
+        parts = [future.result() for future in futures]
+    return pd.concat(parts, ignore_index=True)
 
-def tick_from_json(file, **kwargs):
-    return pd.read_json(file, convert_dates=False, lines=True)
+
+def _is_plain_path(file) -> bool:
+    return isinstance(file, str) and not file.endswith(('.gz', '.zst', '.bz2', '.xz', '.zip'))
+
+
+def tick_from_json(file, chunksize=None, usecols=None, jobs=None, **kwargs):
+    """Read ticks from JSON lines.
+
+    Uncompressed files are split into byte ranges on line boundaries and
+    parsed by jobs= worker processes, using orjson when it is installed.
+    Streams, compressed files and chunked reads go through pandas.
+    """
+    if _is_plain_path(file) and not chunksize:
+        columns = usecols.split(',') if usecols else None
+        return _parallel_json(file, _parse_tick_range, columns, jobs=jobs)
+
+    file, compression = _decompressed(file)
+    data = pd.read_json(
+        file,
+        convert_dates=False,
+        dtype=False,
+        lines=True,
+        chunksize=chunksize,
+        compression=compression
+    )
+    return _typed_chunks(data, TICK_DTYPES, usecols.split(',') if usecols else None)
+
+
+def tick_from_parquet(file, chunksize=None, usecols=None, **kwargs):
+    import pyarrow.parquet as pq
+
+    columns = usecols.split(',') if usecols else None
+    if chunksize:
+        batches = pq.ParquetFile(file).iter_batches(batch_size=chunksize, columns=columns)
+        return (batch.to_pandas() for batch in batches)
+    return pd.read_parquet(file, columns=columns)
+
+
+def tick_from_arrow(file, chunksize=None, usecols=None, **kwargs):
+    import pyarrow as pa
+
+    reader = pa.ipc.open_file(file)
+    columns = usecols.split(',') if usecols else None
+
+    def _batch(i):
+        batch = reader.get_batch(i)
+        if columns:
+            batch = batch.select(columns)
+        return batch.to_pandas()
+
+    if chunksize:
+        # Record batches are already bounded by the writer's row group size
+        return (_batch(i) for i in range(reader.num_record_batches))
+    table = reader.read_all()
+    if columns:
+        table = table.select(columns)
+    return table.to_pandas()
+
+
+# Fields recorded by scripts/orderdiff.py
+DIFF_COLUMNS = ['id', 'price', 'amount', 'order_type', 'diff_type', 'microtimestamp']
+
+
+def diff_from_csv(file, chunksize=None, usecols=None, **kwargs):
+    # Collector files start with a header line, which is replaced by names
+    names, header = DIFF_COLUMNS, 0
+    if 'header' in kwargs:
+        names, header = kwargs['header'].split(','), None
+    return _read_typed_csv(file, DIFF_DTYPES, chunksize, usecols, names=names, header=header)
+
+
+@contextlib.contextmanager
+def _open_lines(file):
+    """Yield a text stream over a path or buffer, decompressing as needed."""
+    if isinstance(file, str):
+        from datasink.reader import _open_text
+        with _open_text(file) as f:
+            yield f
+        return
+
+    buf, codec = _decompressed(file)
+    if codec == 'gzip':
+        import gzip
+        yield gzip.open(buf, mode='rt', encoding='utf8')
+    elif codec == 'zstd':
+        import zstandard
+        yield zstandard.open(buf, mode='rt', encoding='utf8')
+    else:
+        yield buf
+
+
+def _iter_snapshots(file):
+    """Yield order book snapshots written by scripts/orderbook.py in order."""
+    loads = _json_loads()
+    with _open_lines(file) as f:
+        for line in f:
+            if line.strip():
+                yield loads(line)
+
+
+def _snapshot_levels(levels, depth: int) -> np.ndarray:
+    """Return the first depth [price, amount] pairs padded with NaN."""
+    out = np.full((depth, 2), np.nan)
+    levels = levels[:depth]
+    if levels:
+        # Some endpoints append an order id to each level
+        out[:len(levels)] = np.array([level[:2] for level in levels], dtype=float)
+    return out
+
+
+def _snapshots_to_book(snapshots, depth: int) -> pd.DataFrame:
+    n = len(snapshots)
+    bids = np.empty((n, depth, 2))
+    asks = np.empty((n, depth, 2))
+    for i, snapshot in enumerate(snapshots):
+        bids[i] = _snapshot_levels(snapshot['bids'], depth)
+        asks[i] = _snapshot_levels(snapshot['asks'], depth)
+
+    book = pd.DataFrame(
+        np.hstack([bids[:, :, 0], bids[:, :, 1], asks[:, :, 0], asks[:, :, 1]]),
+        columns=_book_columns(depth)[1:]
+    )
+    book.insert(0, 'microtimestamp', np.array(
+        [int(snapshot['microtimestamp']) for snapshot in snapshots], dtype=np.int64
+    ))
+    return book
+
+
+def orderbook_from_json(file, chunksize=None, **kwargs):
+    """Read order book snapshots into wide books of a fixed depth.
+
+    Levels beyond depth= (default 100) per side are dropped, missing levels
+    are NaN. With chunksize, books are yielded that many snapshots at a time,
+    otherwise uncompressed files are parsed in parallel as in tick_from_json.
+    """
+    depth = int(kwargs.get('depth', 100))
+
+    if not chunksize:
+        if _is_plain_path(file):
+            return _parallel_json(file, _parse_book_range, depth, jobs=kwargs.get('jobs'))
+        return _snapshots_to_book(list(_iter_snapshots(file)), depth)
+
+    def _chunks():
+        snapshots = []
+        for snapshot in _iter_snapshots(file):
+            snapshots.append(snapshot)
+            if len(snapshots) == chunksize:
+                yield _snapshots_to_book(snapshots, depth)
+                snapshots = []
+        if snapshots:
+            yield _snapshots_to_book(snapshots, depth)
+
+    return _chunks()
+
+
+def book_from_csv(file, chunksize=None, **kwargs):
+    file, compression = _decompressed(file)
+    return pd.read_csv(file, chunksize=chunksize, compression=compression)
 
 
 # -----------------------
 # | Conversion routines |
 # -----------------------
 
-def tick_to_candle(tick: pd.DataFrame, **kwargs) -> pd.DataFrame:
-    """Convert tick data to candle data."""
+CANDLE_COLUMNS = ['open', 'close', 'high', 'low', 'volume', 'timestamp']
+
+
+def _aggregate_ticks(tick: pd.DataFrame, keys: np.ndarray) -> pd.DataFrame:
+    """Aggregate time ordered ticks into one bar per key, indexed by key."""
+    grouped = tick.groupby(keys, sort=True)
+    price   = grouped['price']
+
+    return pd.DataFrame({
+        'open': price.first(),
+        'close': price.last(),
+        'high': price.max(),
+        'low': price.min(),
+        'volume': grouped['amount'].sum(),
+    })
+
+
+def _bucket_ticks(tick: pd.DataFrame, period: int) -> pd.DataFrame:
+    """Aggregate ticks into sparse candles, one row for every non-empty bar."""
+    # Stable sort keeps the arrival order of ticks sharing a timestamp
+    tick   = tick.sort_values('timestamp', kind='mergesort')
+    bucket = _round_down_nearest(tick['timestamp'].values, period).astype(np.int64)
+
+    bars = _aggregate_ticks(tick, bucket)
+    bars['timestamp'] = bars.index
+    return bars.reset_index(drop=True)
+
+
+def _resample_bars(bars: pd.DataFrame, period: int) -> pd.DataFrame:
+    """Aggregate sparse candles into sparse candles of a multiple period.
+
+    Rows sharing a bar keep their relative order, so partial candles of the
+    same bar can be combined by concatenating them in time order.
+    """
+    bucket  = _round_down_nearest(bars['timestamp'].values, period).astype(np.int64)
+    grouped = bars.groupby(bucket, sort=True)
+
+    out = pd.DataFrame({
+        'open': grouped['open'].first(),
+        'close': grouped['close'].last(),
+        'high': grouped['high'].max(),
+        'low': grouped['low'].min(),
+        'volume': grouped['volume'].sum(),
+    })
+    out['timestamp'] = out.index
+    return out.reset_index(drop=True)
+
+
+def _fill_bars(
+        bars: pd.DataFrame,
+        period: int,
+        start=None,
+        end=None,
+        prev_close=None
+    ) -> pd.DataFrame:
+    """Insert flat zero volume candles for bars in [start, end) without ticks.
+
+    Leading empty bars are flat at prev_close when one is provided.
+    """
+    if bars.empty:
+        return pd.DataFrame(columns=CANDLE_COLUMNS)
+
+    if start is None:
+        start = bars['timestamp'].iloc[0]
+    if end is None:
+        end = bars['timestamp'].iloc[-1] + period
+
+    bars  = bars.set_index('timestamp').reindex(np.arange(start, end, period, dtype=np.int64))
+    close = bars['close'].ffill()
+    if prev_close is not None:
+        close = close.fillna(prev_close)
+    bars  = pd.DataFrame({
+        'open': bars['open'].fillna(close),
+        'close': close,
+        'high': bars['high'].fillna(close),
+        'low': bars['low'].fillna(close),
+        'volume': bars['volume'].fillna(0),
+        'timestamp': bars.index,
+    })
+    return bars.reset_index(drop=True)
+
+
+def _parse_periods(period) -> list:
+    """Parse a comma separated list of periods, finest first."""
+    periods = sorted({int(p) for p in str(period).split(',')})
+    for p in periods[1:]:
+        if p % periods[0]:
+            raise ValueError('Period {} is not a multiple of {}'.format(p, periods[0]))
+    return periods
+
+
+def _pyramid(periods) -> list:
+    """Pair every coarser period with the coarsest finer period dividing it."""
+    return [(p, max(q for q in periods[:i] if not p % q)) for i, p in enumerate(periods) if i]
+
+
+def tick_to_candle(tick: pd.DataFrame, **kwargs):
+    """Convert tick data to candle data.
+
+    Ticks are bucketed by ``timestamp // period`` and aggregated per bucket.
+    Open and close are the first and last ticks in time. Bars without ticks
+    are flat at the previous close with zero volume.
+
+    Several comma separated periods build a candle pyramid in a single pass
+    over the ticks. Only the finest period is aggregated from ticks, every
+    coarser one is derived from finer candles, and a dict of candles keyed by
+    period is returned.
+    """
 
     # Options
-    period = int(kwargs['period'])
+    periods = _parse_periods(kwargs['period'])
+
+    return _candle_pyramid(_bucket_ticks(tick, periods[0]), periods)
+
+
+def tick_to_sparse_candle(tick: pd.DataFrame, **kwargs) -> pd.DataFrame:
+    """Aggregate ticks of one partition into candles of the finest period.
+
+    Only bars with ticks are returned. Bars straddling partition edges are
+    partial, and sparse_candle_to_candle merges them.
+    """
+    return _bucket_ticks(tick, _parse_periods(kwargs['period'])[0])
+
+
+def sparse_candle_to_candle(bars: pd.DataFrame, **kwargs):
+    """Merge sparse candles of consecutive partitions, in order, into candles."""
+    periods = _parse_periods(kwargs['period'])
+    return _candle_pyramid(_resample_bars(bars, periods[0]), periods)
+
+
+def _candle_pyramid(sparse: pd.DataFrame, periods):
+    """Derive and fill candles of every period from the finest sparse ones."""
+    sparse = {periods[0]: sparse}
+    for period, finer in _pyramid(periods):
+        sparse[period] = _resample_bars(sparse[finer], period)
+    logging.info('Collected {} candles'.format(len(sparse[periods[0]])))
+
+    candles = {period: _fill_bars(bars, period) for period, bars in sparse.items()}
+    if len(periods) == 1:
+        return candles[periods[0]]
+    return candles
+
+
+class CandleStream:
+    """Incremental tick to candle conversion over time ordered chunks.
+
+    The last bar of every chunk may still receive ticks from the next chunk,
+    so it is carried over as a partial candle and only emitted once a later
+    bar is seen or the stream is flushed. Memory use is bounded by the size
+    of a single chunk.
+
+    With several periods, completed candles of a finer period are fed into
+    the next coarser one, as in tick_to_candle, and dicts of candles keyed by
+    period are returned.
+    """
+
+    def __init__(self, **kwargs):
+        self.periods = _parse_periods(kwargs['period'])
+        self.period  = self.periods[0]
+
+        self._partial = dict.fromkeys(self.periods)
+        self._next    = dict.fromkeys(self.periods)
+        self._close   = dict.fromkeys(self.periods)
+
+    def push(self, tick: pd.DataFrame):
+        """Consume a chunk of ticks and return the candles it completes."""
+        return self._cascade(_bucket_ticks(tick, self.period), final=False)
+
+    def flush(self):
+        """Return the carried partial candles once the input is exhausted."""
+        return self._cascade(None, final=True)
+
+    def _cascade(self, bars, final):
+        # Every coarser period draws on the finer period dividing it
+        source = dict(_pyramid(self.periods))
+
+        completed = {}
+        out = {}
+        for period in self.periods:
+            if period in source:
+                bars = completed[source[period]]
+            completed[period] = self._complete(period, bars, final)
+            out[period] = self._emit(period, completed[period])
+
+        if len(self.periods) == 1:
+            return out[self.period]
+        return out
+
+    def _complete(self, period, bars, final):
+        """Merge sparse bars into the carry and return the completed ones."""
+        partial = self._partial[period]
+
+        if bars is not None and not bars.empty:
+            if partial is not None:
+                bars = pd.concat([partial, bars])
+            bars = _resample_bars(bars, period)
+        elif partial is not None:
+            bars = partial
+        else:
+            return pd.DataFrame(columns=CANDLE_COLUMNS)
+
+        if self._next[period] is not None:
+            late = bars['timestamp'].values < self._next[period]
+            if late.any():
+                logging.warning('Dropping {} bars of late ticks'.format(late.sum()))
+                bars = bars[~late]
+
+        if final or bars.empty:
+            self._partial[period] = None
+            return bars
 
-    tick = tick.set_index('timestamp') \
-               .sort_index()
+        self._partial[period] = bars.iloc[-1:]
+        return bars.iloc[:-1]
 
-    start = _round_down_nearest(tick.index.min(), period)
-    end   = _round_down_nearest(tick.index.max(), period) + period
-    bars  = []
+    def _emit(self, period, bars):
+        if bars.empty:
+            return pd.DataFrame(columns=CANDLE_COLUMNS)
 
-    for idx, itr in enumerate(range(start, end, period)):
-        if not (idx % 100):
-            logging.info('Collected {} candles'.format(idx))
+        bars = _fill_bars(
+            bars, period, start=self._next[period], prev_close=self._close[period]
+        )
+        self._next[period]  = bars['timestamp'].iloc[-1] + period
+        self._close[period] = bars['close'].iloc[-1]
+        return bars
 
-        index     = (tick.index >= itr) & (tick.index < itr + period)
-        bar_ticks = tick[index]
 
-        if bar_ticks.empty:
-            op = cl = hi = lo = bars[-1][1]
-            vol = 0
+class LiveCandle:
+    """Candle of a single period updated one tick at a time.
+
+    Every update is O(1): the open bar's fields are adjusted in place, and
+    bars are only built when a period closes, either on the first tick of a
+    later bar or by expire() once the clock passes the end of the bar. Empty
+    bars in between are flat at the previous close. Ticks of bars already
+    emitted are dropped.
+    """
+
+    def __init__(self, period):
+        self.period = int(period)
+
+        self._bar   = None
+        self._open  = self._high = self._low = self._close = None
+        self._volume = 0.0
+        self._next  = None
+
+    def update(self, price, amount, timestamp) -> list:
+        """Add a tick and return the rows of the bars it closes."""
+        bar = _round_down_nearest(int(timestamp), self.period)
+        if self._next is not None and bar < self._next:
+            logging.warning('Dropping late tick at {}'.format(timestamp))
+            return []
+
+        if self._bar is None:
+            rows = self._fill(bar)
+        elif bar > self._bar:
+            rows = self._close_until(bar)
         else:
-            op  = bar_ticks.min().price
-            cl  = bar_ticks.max().price
-            hi  = bar_ticks.price.max()
-            lo  = bar_ticks.price.min()
-            vol = bar_ticks.amount.sum()
-        ts  = itr
+            rows = []
+
+        if self._bar is None:
+            self._bar = bar
+            self._open = self._high = self._low = price
+            self._volume = 0.0
+
+        self._high   = max(self._high, price)
+        self._low    = min(self._low, price)
+        self._close  = price
+        self._volume += amount
+        return rows
+
+    def expire(self, now) -> list:
+        """Return the rows of the bars that ended before now."""
+        bar = _round_down_nearest(int(now), self.period)
+        if self._bar is not None:
+            if bar <= self._bar:
+                return []
+            return self._close_until(bar)
+        return self._fill(bar)
+
+    def _close_until(self, bar) -> list:
+        """Emit the open bar and the empty bars following it up to bar."""
+        rows = [(self._open, self._close, self._high, self._low, self._volume, self._bar)]
+        self._next = self._bar + self.period
+        self._bar  = None
+        return rows + self._fill(bar)
+
+    def _fill(self, bar) -> list:
+        """Emit flat bars at the last close from the next bar up to bar."""
+        if self._next is None or bar <= self._next:
+            return []
+        close = self._close
+        rows  = [(close, close, close, close, 0.0, t)
+                    for t in range(self._next, bar, self.period)]
+        self._next = bar
+        return rows
+
+
+# Quantity sampled by each type of event driven bar
+_BAR_MEASURES = {
+        'volume': lambda tick: tick['amount'].values.astype(float),
+        'dollar': lambda tick: (tick['price'].values * tick['amount'].values).astype(float),
+        'tick': lambda tick: np.ones(len(tick)),
+}
+
+
+def _event_keys(tick: pd.DataFrame, measure: str, threshold: float, base=0.0):
+    """Return the bar of every tick and the cumulative measure after it.
+
+    Bar k holds the ticks arriving while the cumulative measure, counted from
+    the start of the input, is in [k * threshold, (k + 1) * threshold). The
+    overshoot of the tick closing a bar is therefore counted towards the next
+    one, which keeps every bar boundary a plain function of the cumulative sum.
+    """
+    cum    = base + np.cumsum(_BAR_MEASURES[measure](tick))
+    before = np.concatenate([[base], cum[:-1]])
+    return (before // threshold).astype(np.int64), cum
+
+
+def _event_bars(tick: pd.DataFrame, keys: np.ndarray) -> pd.DataFrame:
+    """Aggregate ticks into bars, timestamped by the first tick of each bar."""
+    if tick.empty:
+        return pd.DataFrame(columns=CANDLE_COLUMNS)
+    bars = _aggregate_ticks(tick, keys)
+    bars['timestamp'] = tick.groupby(keys, sort=True)['timestamp'].first()
+    return bars.reset_index(drop=True)
+
+
+def _tick_to_event_bar(measure: str, tick: pd.DataFrame, **kwargs) -> pd.DataFrame:
+    tick = tick.sort_values('timestamp', kind='mergesort')
+    keys, _ = _event_keys(tick, measure, float(kwargs['threshold']))
+    return _event_bars(tick, keys)
+
+
+def tick_to_volume_bar(tick: pd.DataFrame, **kwargs) -> pd.DataFrame:
+    """Convert tick data to bars closing every threshold= of traded amount.
+
+    Bars have the columns of candles, timestamped by their first tick. The
+    last bar may be incomplete.
+    """
+    return _tick_to_event_bar('volume', tick, **kwargs)
+
+
+def tick_to_dollar_bar(tick: pd.DataFrame, **kwargs) -> pd.DataFrame:
+    """Convert tick data to bars closing every threshold= of traded notional."""
+    return _tick_to_event_bar('dollar', tick, **kwargs)
+
+
+def tick_to_tick_bar(tick: pd.DataFrame, **kwargs) -> pd.DataFrame:
+    """Convert tick data to bars closing every threshold= ticks."""
+    return _tick_to_event_bar('tick', tick, **kwargs)
+
+
+class EventBarStream:
+    """Incremental tick to event driven bar conversion over time ordered chunks.
+
+    Ticks of the last, still open bar are carried over to the next chunk
+    together with the cumulative measure before them, so streamed bars match
+    those of the whole input. Memory use is bounded by a chunk plus one bar.
+
+    Args
+    ----
+    measure : str
+        'volume', 'dollar' or 'tick'
+
+    """
+
+    def __init__(self, measure, **kwargs):
+        self.measure   = measure
+        self.threshold = float(kwargs['threshold'])
+
+        self._partial = None
+        self._base    = 0.0
+
+    def push(self, tick: pd.DataFrame) -> pd.DataFrame:
+        """Consume a chunk of ticks and return the bars it completes."""
+        if self._partial is not None:
+            tick = pd.concat([self._partial, tick])
+        tick = tick.sort_values('timestamp', kind='mergesort')
+        if tick.empty:
+            return pd.DataFrame(columns=CANDLE_COLUMNS)
 
-        bars.append((op, cl, hi, lo, vol, ts))
+        keys, cum = _event_keys(tick, self.measure, self.threshold, self._base)
 
-    return pd.DataFrame(bars, columns=['open', 'close', 'high', 'low', 'volume', 'timestamp'])
+        # The last bar is open unless its closing tick was seen
+        last = keys[-1]
+        if cum[-1] >= (last + 1) * self.threshold:
+            last += 1
+        done = int(np.searchsorted(keys, last, side='left'))
+
+        if done:
+            self._base = cum[done - 1]
+        self._partial = tick.iloc[done:]
+        return _event_bars(tick.iloc[:done], keys[:done])
+
+    def flush(self) -> pd.DataFrame:
+        """Return the carried open bar once the input is exhausted."""
+        tick, self._partial = self._partial, None
+        if tick is None or tick.empty:
+            return pd.DataFrame(columns=CANDLE_COLUMNS)
+        keys, _ = _event_keys(tick, self.measure, self.threshold, self._base)
+        return _event_bars(tick, keys)
+
+
+def _book_columns(depth: int) -> list:
+    return ['microtimestamp'] + [
+        '{}_{}_{}'.format(side, field, level)
+            for side in ('bid', 'ask')
+            for field in ('price', 'amount')
+            for level in range(depth)
+    ]
+
+
+class OrderBook:
+    """Price level order book replayed from Bitstamp order diffs.
+
+    Levels are kept in one dict per side mapping price to total amount, next
+    to a sorted index of the prices, best first, maintained with bisection.
+    Only diffs that open or empty a level touch the index, and emitting a
+    book reads the first depth prices of it. Individual orders are tracked
+    to turn deletes and takes into level deltas. Orders resting before the
+    seeding snapshot are unknown: their deletes subtract the deleted amount,
+    and their takes cannot be applied until they are seen again.
+
+    Args
+    ----
+    interval : float
+        Seconds between emitted books
+    depth : int
+        Number of levels per side in emitted books
+
+    """
+
+    # Diff types
+    CREATE = 'create'
+    DELETE = 'delete'
+    TAKE   = 'take'
+
+    # Amounts below this are treated as an emptied level
+    EPSILON = 1e-12
+
+    def __init__(self, interval=1, depth=10):
+        self.interval = int(float(interval) * 1e6)
+        self.depth = int(depth)
+
+        self.bids = {}
+        self.asks = {}
+        self._index = ([], [])
+        self._orders = {}
+        self._seeded = None
+        self._next = None
+
+    def seed(self, snapshot):
+        """Reset the levels to a snapshot from the order book REST API."""
+        # Some endpoints append an order id to each level
+        self.bids = {float(level[0]): float(level[1]) for level in snapshot['bids']}
+        self.asks = {float(level[0]): float(level[1]) for level in snapshot['asks']}
+        self._index = (sorted(-price for price in self.bids), sorted(self.asks))
+        self._orders = {}
+        self._seeded = int(snapshot['microtimestamp'])
+
+    def top(self):
+        """Return a flat row of the top levels, padded with NaN."""
+        row = np.full(4 * self.depth, np.nan)
+        d = self.depth
+        for offset, levels, keys, sign in ((0, self.bids, self._index[0], -1),
+                                           (2 * d, self.asks, self._index[1], 1)):
+            prices = [sign * key for key in keys[:d]]
+            row[offset:offset + len(prices)] = prices
+            row[offset + d:offset + d + len(prices)] = [levels[p] for p in prices]
+        return row
+
+    def replay(self, diff: pd.DataFrame) -> pd.DataFrame:
+        """Apply time ordered diffs and return the books emitted meanwhile."""
+        diff = diff.sort_values('microtimestamp', kind='mergesort')
+        if self._seeded is not None:
+            diff = diff[diff['microtimestamp'].values > self._seeded]
+        if diff.empty:
+            return pd.DataFrame(columns=_book_columns(self.depth))
+
+        # Category codes follow CREATE, DELETE, TAKE
+        kinds = diff['diff_type'].astype(DIFF_DTYPES['diff_type']).cat.codes
+        ts    = diff['microtimestamp'].values
+
+        if self._next is None:
+            self._next = (int(ts[0]) // self.interval + 1) * self.interval
+
+        interval = self.interval
+        epsilon  = self.EPSILON
+        orders   = self._orders
+        sides    = (self.bids, self.asks)
+        index    = self._index
+        emitted  = []
+        times    = []
+        nxt      = self._next
+
+        for oid, price, amount, side, kind, t in zip(
+                diff['id'].tolist(),
+                diff['price'].tolist(),
+                diff['amount'].tolist(),
+                diff['order_type'].tolist(),
+                kinds.tolist(),
+                ts.tolist()):
+
+            # Books are sampled just before the first diff past each boundary
+            if t >= nxt:
+                row = self.top()
+                while nxt <= t:
+                    emitted.append(row)
+                    times.append(nxt)
+                    nxt += interval
+
+            levels = sides[side]
+
+            level = levels.get(price)
+
+            if kind == 0:
+                orders[oid] = amount
+                if level is None:
+                    levels[price] = amount
+                    insort(index[side], -price if side == 0 else price)
+                else:
+                    levels[price] = level + amount
+                continue
+
+            old = orders.pop(oid, None)
+            if kind == 1:
+                delta = amount if old is None else old
+            else:
+                orders[oid] = amount
+                if old is None:
+                    continue
+                delta = old - amount
+
+            if level is None:
+                continue
+            left = level - delta
+            if left > epsilon:
+                levels[price] = left
+            else:
+                del levels[price]
+                keys = index[side]
+                del keys[bisect_left(keys, -price if side == 0 else price)]
+
+        self._next = nxt
+
+        books = pd.DataFrame(
+            np.array(emitted).reshape(len(emitted), 4 * self.depth),
+            columns=_book_columns(self.depth)[1:]
+        )
+        books.insert(0, 'microtimestamp', np.array(times, dtype=np.int64))
+        return books
+
+
+def _nearest_snapshot(path, t):
+    """Return the latest snapshot taken at or before t, else the earliest."""
+    nearest = None
+    for snapshot in _iter_snapshots(path):
+        if nearest is None or int(snapshot['microtimestamp']) <= t:
+            nearest = snapshot
+        else:
+            break
+    return nearest
+
+
+def diff_to_book(diff: pd.DataFrame, **kwargs) -> pd.DataFrame:
+    """Replay order diffs into L2 books sampled at a fixed interval.
+
+    The book is seeded from the snapshot file given as snapshot= nearest to
+    the first diff, and diffs up to the snapshot time are skipped. interval=
+    is in seconds and depth= is the number of levels per side.
+    """
+    book = OrderBook(kwargs.get('interval', 1), kwargs.get('depth', 10))
+    if 'snapshot' in kwargs:
+        book.seed(_nearest_snapshot(kwargs['snapshot'], diff['microtimestamp'].min()))
+    return book.replay(diff)
+
+
+def _book_arrays(book: pd.DataFrame):
+    """Return bid and ask (price, amount) arrays of shape (rows, depth)."""
+    depth = sum(1 for c in book.columns if c.startswith('bid_price_'))
+    values = book[_book_columns(depth)[1:]].to_numpy(dtype=float)
+    bp, ba, ap, aa = np.hsplit(values, 4)
+    return bp, ba, ap, aa
+
+
+def book_to_features(book: pd.DataFrame, **kwargs) -> pd.DataFrame:
+    """Compute spread, depth and imbalance features of wide books.
+
+    Depth is the total amount resting within each distance of the mid price
+    in the grid given as bps= (comma separated basis points, default
+    5,10,25,50). Imbalance is (bid - ask) / (bid + ask) of the top level and
+    of the depth at each distance. Every feature is computed for all books
+    at once on (rows, depth) arrays.
+    """
+    grid = [float(b) for b in str(kwargs.get('bps', '5,10,25,50')).split(',')]
+    bp, ba, ap, aa = _book_arrays(book)
+
+    features = pd.DataFrame({'microtimestamp': book['microtimestamp'].values})
+    mid    = (bp[:, 0] + ap[:, 0]) / 2
+    spread = ap[:, 0] - bp[:, 0]
+
+    features['mid']        = mid
+    features['spread']     = spread
+    features['spread_bps'] = spread / mid * 1e4
+    with np.errstate(invalid='ignore', divide='ignore'):
+        features['imbalance'] = (ba[:, 0] - aa[:, 0]) / (ba[:, 0] + aa[:, 0])
+
+    # NaN prices of missing levels compare False and drop out of the sums
+    ba = np.nan_to_num(ba)
+    aa = np.nan_to_num(aa)
+    for bps in grid:
+        name = '{:g}'.format(bps)
+        with np.errstate(invalid='ignore'):
+            bid = np.where(bp >= (mid * (1 - bps / 1e4))[:, None], ba, 0).sum(axis=1)
+            ask = np.where(ap <= (mid * (1 + bps / 1e4))[:, None], aa, 0).sum(axis=1)
+            features['bid_depth_' + name] = bid
+            features['ask_depth_' + name] = ask
+            features['imbalance_' + name] = (bid - ask) / (bid + ask)
+
+    return features
+
+
+class FeatureStream:
+    """Book features are computed per book, so chunks convert independently."""
+
+    def __init__(self, **kwargs):
+        self._kwargs = kwargs
+
+    def push(self, book: pd.DataFrame) -> pd.DataFrame:
+        return book_to_features(book, **self._kwargs)
+
+    def flush(self) -> pd.DataFrame:
+        return pd.DataFrame()
+
+
+class BookStream:
+    """Incremental diff to book conversion over time ordered chunks."""
+
+    def __init__(self, **kwargs):
+        self._kwargs = kwargs
+        self._book = None
+
+    def push(self, diff: pd.DataFrame) -> pd.DataFrame:
+        if self._book is None:
+            self._book = OrderBook(
+                self._kwargs.get('interval', 1), self._kwargs.get('depth', 10)
+            )
+            if 'snapshot' in self._kwargs:
+                self._book.seed(
+                    _nearest_snapshot(self._kwargs['snapshot'], diff['microtimestamp'].min())
+                )
+        return self._book.replay(diff)
+
+    def flush(self) -> pd.DataFrame:
+        return pd.DataFrame()
 
 
 # -------------------
 # | Output routines |
 # -------------------
 
-def tick_to_tuple(data: pd.DataFrame, file):
-    for idx, row in data.iterrows():
-        file.write('({},{},{},{})\n'.format(
-            row.price,
-            row.timestamp,
-            row.amount,
-            row.type,
-        ))
+def _write_tuples(file, fmt: str, columns, chunksize=100000):
+    """Format columns row by row into fmt and write them in large buffers."""
+    for start in range(0, len(columns[0]), chunksize):
+        rows = [column[start:start + chunksize].tolist() for column in columns]
+        file.write(''.join(map(fmt.format, *rows)))
+
+
+def tick_to_tuple(data: pd.DataFrame, file, **kwargs):
+    columns = [data[name] for name in ('price', 'timestamp', 'amount', 'type')]
 
+    # Rows of an all numeric frame are upcast to float, as iterrows() does
+    if all(pd.api.types.is_numeric_dtype(dtype) for dtype in data.dtypes) \
+            and any(pd.api.types.is_float_dtype(dtype) for dtype in data.dtypes):
+        columns = [column.astype(np.float64) for column in columns]
 
-def tick_to_csv(data: pd.DataFrame, file):
-    data.to_csv(file, columns=('price', 'timestamp', 'amount', 'type'), index=False)
+    _write_tuples(file, '({},{},{},{})\n', columns)
+
+
+def tick_to_csv(data: pd.DataFrame, file, append=False, **kwargs):
+    data.to_csv(
+        file,
+        columns=('price', 'timestamp', 'amount', 'type'),
+        index=False,
+        header=not append
+    )
 
 
 def candle_to_tuple(data: pd.DataFrame, file, **kwargs):
-    for idx, row in data.iterrows():
-        file.write('({},{},{},{},{},{},{})\n'.format(
-            row.open,
-            row.high,
-            row.low,
-            row.close,
-            row.volume,
-            row.timestamp,
-        ))
+    columns = [data[name] for name in ('open', 'high', 'low', 'close', 'volume', 'timestamp')]
+    _write_tuples(file, '({},{},{},{},{},{})\n', columns)
+
+
+def candle_to_csv(data, file, append=False, **kwargs):
+    data.to_csv(file, index=False, header=not append)
+
+
+def book_to_csv(data, file, append=False, **kwargs):
+    data.to_csv(file, index=False, header=not append)
+
+
+def features_to_csv(data, file, append=False, **kwargs):
+    data.to_csv(file, index=False, header=not append)
+
+
+# ----------------
+# | Result cache |
+# ----------------
+
+class ResultCache:
+    """On-disk cache of conversion results of unchanged source files.
+
+    Results are keyed by a fingerprint of the source file, the conversion
+    and its options. The fingerprint is the file's path, size and mtime, or
+    a hash of its contents with hash_content=True, so a rewritten file is
+    never served stale. Files modified in the last min_age seconds, such as
+    a partition Datasink is still writing, are converted but not stored.
+
+    Entries are pickled DataFrames or dicts of them. Reads refresh the mtime
+    of an entry, and whenever the cache grows past max_bytes the least
+    recently used entries are evicted. Several processes may share a cache
+    directory.
+
+    Args
+    ----
+    directory : str
+        Directory of cache entries, created if missing
+    max_bytes : int
+        Size bound of the cache
+    hash_content : bool
+        Fingerprint sources by their contents instead of size and mtime
+    min_age : float
+        Seconds since the last modification before a source is cached
+
+    """
+
+    SUFFIX = '.pkl'
+
+    # Options that change how a result is computed but not the result
+    RUNTIME_OPTIONS = frozenset(['jobs'])
+
+    def __init__(self, directory, max_bytes=2**30, hash_content=False, min_age=60):
+        self.directory    = directory
+        self.max_bytes    = int(max_bytes)
+        self.hash_content = hash_content
+        self.min_age      = min_age
+        os.makedirs(directory, mode=0o775, exist_ok=True)
+
+    def key(self, path, *spec) -> str:
+        """Return the cache key of a source file and a conversion spec."""
+        digest = hashlib.sha256()
+        if self.hash_content:
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(2**20), b''):
+                    digest.update(block)
+        else:
+            stat = os.stat(path)
+            digest.update(repr((os.path.abspath(path), stat.st_size, stat.st_mtime_ns)).encode())
+
+        # Options hash alike whatever order they were given in
+        spec = [
+            sorted((k, v) for k, v in item.items() if k not in self.RUNTIME_OPTIONS)
+                if isinstance(item, dict) else item
+                for item in spec
+        ]
+        digest.update(repr(spec).encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Return the cached result of key, None on a miss."""
+        path = os.path.join(self.directory, key + self.SUFFIX)
+        try:
+            data = pd.read_pickle(path)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # Entries are replaced atomically, but a crash or full disk may
+            # still leave one unreadable
+            logging.warning('Ignoring unreadable cache entry {}'.format(path))
+            return None
+
+        # Another process may evict the entry right after it was read
+        with contextlib.suppress(FileNotFoundError):
+            os.utime(path)
+        return data
 
+    def put(self, key, data):
+        path = os.path.join(self.directory, key + self.SUFFIX)
+        tmp  = '{}.{}.tmp'.format(path, os.getpid())
+        pd.to_pickle(data, tmp)
+        os.replace(tmp, path)
+        self.evict()
 
-def candle_to_csv(data, file, **kwargs):
-    data.to_csv(file, index=False)
+    def evict(self):
+        """Delete least recently used entries until the size bound is met."""
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(self.SUFFIX):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+            total -= size
+
+    def fetch(self, path, spec, compute):
+        """Return the cached result of converting path, computing it on a miss."""
+        key  = self.key(path, *spec)
+        data = self.get(key)
+        if data is not None:
+            logging.debug('Cache hit for {}'.format(path))
+            return data
+
+        data = compute()
+        if time.time() - os.path.getmtime(path) >= self.min_age:
+            self.put(key, data)
+        return data
 
 
 # -----------------------------------------------------
@@ -110,11 +1203,42 @@ def candle_to_csv(data, file, **kwargs):
 _read_table = {
         ('tick', 'csv'): tick_from_csv,
         ('tick', 'json'): tick_from_json,
+        ('tick', 'parquet'): _typed_reader(tick_from_parquet, TICK_DTYPES),
+        ('tick', 'arrow'): _typed_reader(tick_from_arrow, TICK_DTYPES),
+        ('diff', 'csv'): diff_from_csv,
+        ('diff', 'parquet'): _typed_reader(tick_from_parquet, DIFF_DTYPES),
+        ('diff', 'arrow'): _typed_reader(tick_from_arrow, DIFF_DTYPES),
+        ('orderbook', 'json'): orderbook_from_json,
+        ('book', 'csv'): book_from_csv,
 }
 
 
 _convert_table = {
         ('tick', 'candle'): tick_to_candle,
+        ('tick', 'volumebar'): tick_to_volume_bar,
+        ('tick', 'dollarbar'): tick_to_dollar_bar,
+        ('tick', 'tickbar'): tick_to_tick_bar,
+        ('diff', 'book'): diff_to_book,
+        ('orderbook', 'features'): book_to_features,
+        ('book', 'features'): book_to_features,
+}
+
+
+_stream_table = {
+        ('tick', 'candle'): CandleStream,
+        ('tick', 'volumebar'): partial(EventBarStream, 'volume'),
+        ('tick', 'dollarbar'): partial(EventBarStream, 'dollar'),
+        ('tick', 'tickbar'): partial(EventBarStream, 'tick'),
+        ('diff', 'book'): BookStream,
+        ('orderbook', 'features'): FeatureStream,
+        ('book', 'features'): FeatureStream,
+}
+
+
+# Conversions split into a per partition step and a step merging the partial
+# results of consecutive partitions
+_partition_table = {
+        ('tick', 'candle'): (tick_to_sparse_candle, sparse_candle_to_candle),
 }
 
 
@@ -123,6 +1247,14 @@ _write_table = {
         ('tick', 'csv'): tick_to_csv,
         ('candle', 'tuple'): candle_to_tuple,
         ('candle', 'csv'): candle_to_csv,
+        ('volumebar', 'tuple'): candle_to_tuple,
+        ('volumebar', 'csv'): candle_to_csv,
+        ('dollarbar', 'tuple'): candle_to_tuple,
+        ('dollarbar', 'csv'): candle_to_csv,
+        ('tickbar', 'tuple'): candle_to_tuple,
+        ('tickbar', 'csv'): candle_to_csv,
+        ('book', 'csv'): book_to_csv,
+        ('features', 'csv'): features_to_csv,
 }
 
 
@@ -178,6 +1310,283 @@ def write_data(file, data, data_fmt, file_fmt, **kwargs):
     return _write_table[(data_fmt, file_fmt)](data, file, **kwargs)
 
 
+def _split_outputs(dest, data):
+    """Pair each output destination with its data.
+
+    Conversions with several outputs return dicts keyed by period, which are
+    written to dest formatted with that period.
+    """
+    if isinstance(data, dict):
+        return [(key, dest.format(period=key), frame) for key, frame in data.items()]
+    return [(None, dest, data)]
+
+
+@contextlib.contextmanager
+def _open_output(dest):
+    """Yield a writable buffer, opening dest when it is a path."""
+    if isinstance(dest, str):
+        with open(dest, 'w') as f:
+            yield f
+    else:
+        yield dest
+
+
+def stream_data(src, dest, input_type, output_type, infile, outfile, chunksize, **kwargs):
+    """ Read, convert and write data in bounded chunks.
+
+    Args
+    ----
+    src : buffer or str
+        Input file or path
+    dest : buffer or str
+        Output file or path
+    input_type : str
+        Finanical data type of input
+    output_type : str
+        Finanical data type of output
+    infile : str
+        File format of input
+    outfile : str
+        File format of output
+    chunksize : int
+        Number of input rows to process at a time
+
+    """
+    chunks = read_data(src, input_type, infile, chunksize=chunksize, **kwargs)
+
+    stream = None
+    if input_type != output_type:
+        stream = _stream_table[(input_type, output_type)](**kwargs)
+
+    with contextlib.ExitStack() as stack:
+        files  = {}
+        append = set()
+
+        def _write(data):
+            for key, path, frame in _split_outputs(dest, data):
+                if frame.empty:
+                    continue
+                if key not in files:
+                    files[key] = stack.enter_context(_open_output(path))
+                write_data(
+                    files[key], frame, output_type, outfile, append=key in append, **kwargs
+                )
+                append.add(key)
+
+        for idx, chunk in enumerate(chunks):
+            logging.info('Processing chunk {}'.format(idx))
+            _write(stream.push(chunk) if stream else chunk)
+
+        if stream:
+            _write(stream.flush())
+
+
+def convert_file(path, input_type, output_type, infile, cache=None, **kwargs):
+    """ Read and convert a file, reusing a cached result if it is unchanged.
+
+    Args
+    ----
+    path : str
+        Name of file to read
+    input_type : str
+        Finanical data type of input
+    output_type : str
+        Finanical data type of output
+    infile : str
+        File format of input
+    cache : ResultCache
+        Cache of conversion results, conversions are not cached if not provided
+
+    """
+    def _compute():
+        data = read_data(path, input_type, infile, **kwargs)
+        if input_type != output_type:
+            data = convert(data, input_type, output_type, **kwargs)
+        return data
+
+    if cache is None:
+        return _compute()
+    return cache.fetch(path, ('convert', input_type, output_type, infile, kwargs), _compute)
+
+
+def follow_data(
+        root,
+        dest,
+        input_type,
+        output_type,
+        outfile,
+        start=None,
+        ext='csv',
+        resolution=Datasink.MINUTE,
+        namemode=2,
+        poll=0.2,
+        **kwargs
+    ):
+    """ Convert ticks to candles live as a Datasink dataset is written.
+
+    Follows the file currently being written and the files it rotates to,
+    updating the open candle with every tick and writing each candle as soon
+    as its period closes. Runs until interrupted.
+
+    Args
+    ----
+    root : str
+        Dataset root written by Datasink
+    dest : buffer or str
+        Output file or path
+    input_type : str
+        Finanical data type of input, only tick is supported
+    output_type : str
+        Finanical data type of output, only candle is supported
+    outfile : str
+        File format of output
+    start : datetime
+        Time to look for the file being written from, defaults to now
+    ext : str
+        File extension of the dataset
+    resolution : str
+        Resolution the dataset was written with
+    namemode : int
+        File naming mode the dataset was written with
+    poll : float
+        Seconds to wait for new ticks before checking the clock
+
+    """
+    if (input_type, output_type) != ('tick', 'candle'):
+        raise ValueError('Only tick to candle conversion can follow a dataset')
+
+    periods = _parse_periods(kwargs['period'])
+    if len(periods) > 1:
+        raise ValueError('Only a single period can be followed')
+
+    # The file header names the columns unless they are given
+    names  = kwargs['header'].split(',') if 'header' in kwargs else None
+    reader = DatasetReader(
+        root,
+        start or datetime.now(),
+        None,
+        ext=ext,
+        resolution=resolution,
+        namemode=namemode,
+        header=names is None
+    )
+    candle = LiveCandle(periods[0])
+    grace  = float(kwargs.get('grace', 0))
+
+    with _open_output(dest) as f:
+        append = False
+
+        def _write(rows):
+            nonlocal append
+            if rows:
+                frame = pd.DataFrame(rows, columns=CANDLE_COLUMNS)
+                write_data(f, frame, output_type, outfile, append=append, **kwargs)
+                f.flush()
+                append = True
+
+        index = None
+        for line in reader.follow(poll=poll):
+            if line is None:
+                _write(candle.expire(time.time() - grace))
+                continue
+
+            if index is None:
+                columns = [_ALIASES.get(c, c) for c in names or reader.columns]
+                index   = [columns.index(c) for c in ('price', 'amount', 'timestamp')]
+
+            fields = line.split(',')
+            _write(candle.update(
+                float(fields[index[0]]), float(fields[index[1]]), int(fields[index[2]])
+            ))
+
+
+def _convert_partition(path, input_type, output_type, infile, kwargs, cache=None):
+    def _compute():
+        data = read_data(path, input_type, infile, **kwargs)
+        if (input_type, output_type) in _partition_table:
+            return _partition_table[(input_type, output_type)][0](data, **kwargs)
+        return data
+
+    if cache is None:
+        return _compute()
+    return cache.fetch(path, ('partition', input_type, output_type, infile, kwargs), _compute)
+
+
+def batch_data(
+        root,
+        start,
+        end,
+        input_type,
+        output_type,
+        infile,
+        ext=None,
+        resolution=Datasink.MINUTE,
+        namemode=2,
+        jobs=None,
+        cache=None,
+        **kwargs
+    ):
+    """ Read and convert a time range of a Datasink dataset in parallel.
+
+    Every partition file in the range is read and, where the conversion
+    supports it, partially converted in a process pool. The partial results
+    are then stitched back together in time order, merging results that
+    straddle partition edges.
+
+    Args
+    ----
+    root : str
+        Dataset root written by Datasink
+    start : datetime
+        Start of the time range, inclusive
+    end : datetime
+        End of the time range, exclusive
+    input_type : str
+        Finanical data type of input
+    output_type : str
+        Finanical data type of output
+    infile : str
+        File format of input
+    ext : str
+        File extension of the dataset, defaults to infile
+    resolution : str
+        Resolution the dataset was written with
+    namemode : int
+        File naming mode the dataset was written with
+    jobs : int
+        Number of worker processes, defaults to the number of cores
+    cache : ResultCache
+        Cache of partial results of each partition, so only partitions that
+        changed since a previous run are converted again
+
+    """
+    reader = DatasetReader(
+        root, start, end, ext=ext or infile, resolution=resolution, namemode=namemode
+    )
+    paths = [str(path) for path in reader.files()]
+    if not paths:
+        raise FileNotFoundError('No partitions under {} between {} and {}'.format(root, start, end))
+    logging.info('Converting {} partitions'.format(len(paths)))
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        parts = list(pool.map(
+            _convert_partition,
+            paths,
+            repeat(input_type),
+            repeat(output_type),
+            repeat(infile),
+            repeat(kwargs),
+            repeat(cache),
+        ))
+
+    data = pd.concat(parts, ignore_index=True)
+    if input_type == output_type:
+        return data
+    if (input_type, output_type) in _partition_table:
+        return _partition_table[(input_type, output_type)][1](data, **kwargs)
+    return convert(data, input_type, output_type, **kwargs)
+
+
 @click.command()
 @click.option(
     '-i', '--infile', default='csv', show_default=True,
@@ -187,17 +1596,47 @@ def write_data(file, data, data_fmt, file_fmt, **kwargs):
     '-o', '--outfile', default='csv', show_default=True,
     help='Output data file format'
 )
-@click.option('-s', '--src', default=sys.stdin,
+@click.option('-s', '--src', default=None,
     help='Name of file to read, read from stdin if not provided'
 )
-@click.option('-d', '--dest', default=sys.stdout,
+@click.option('-d', '--dest', default=None,
     help='Name of file to write, write to stdout if not provided'
 )
 @click.option('--output-type', default=None, help='Data type of output')
+@click.option('--chunksize', default=None, type=int,
+    help='Stream the input in chunks of this many rows'
+)
+@click.option('--root', default=None,
+    help='Convert a Datasink dataset under this root instead of --src'
+)
+@click.option('--start', type=click.DateTime(), default=None,
+    help='Start of the dataset time range, inclusive'
+)
+@click.option('--end', type=click.DateTime(), default=None,
+    help='End of the dataset time range, exclusive'
+)
+@click.option('--ext', default=None, help='File extension of the dataset, defaults to infile')
+@click.option('--resolution', default=Datasink.MINUTE, show_default=True,
+    help='Resolution of the dataset'
+)
+@click.option('--namemode', default=2, show_default=True, help='Naming mode of the dataset')
+@click.option('-j', '--jobs', default=None, type=int,
+    help='Number of worker processes for datasets, defaults to the number of cores'
+)
+@click.option('--follow', is_flag=True,
+    help='Convert the dataset under --root live as it is written'
+)
+@click.option('--cache', default=None,
+    help='Directory to cache conversions of unchanged input files in'
+)
+@click.option('--cache-size', default=1024, show_default=True,
+    help='Size bound of the cache in MB'
+)
 @click.argument('input-type')
 @click.argument('kwargs', nargs=-1)
 @click.pass_context
-def main(ctx, infile, outfile, input_type, output_type, src, dest, kwargs):
+def main(ctx, infile, outfile, input_type, output_type, src, dest, chunksize, root, start, end,
+         ext, resolution, namemode, jobs, follow, cache, cache_size, kwargs):
     """Entry point of the financial data conversion tool."""
     logging.basicConfig(level=logging.INFO)
 
@@ -215,15 +1654,61 @@ def main(ctx, infile, outfile, input_type, output_type, src, dest, kwargs):
     if output_type is None:
          output_type = input_type
 
-    # Read
-    data = read_data(src, input_type, infile, **kws)
+    if ',' in kws.get('period', '') and '{period}' not in (dest or ''):
+        ctx.fail('Several periods need a --dest containing {period}')
 
-    # Convert financial data types
-    if input_type != output_type:
-        data = convert(data, input_type, output_type, **kws)
+    # Click would stringify stream defaults, so resolve them here
+    src  = sys.stdin if src is None else src
+    dest = sys.stdout if dest is None else dest
+
+    if cache:
+        cache = ResultCache(cache, max_bytes=cache_size * 2**20)
+
+    if follow:
+        if not root:
+            ctx.fail('Following needs a dataset --root')
+
+        try:
+            return follow_data(
+                root, dest, input_type, output_type, outfile, start=start,
+                ext=ext or infile, resolution=resolution, namemode=namemode, **kws
+            )
+        except KeyboardInterrupt:
+            return
+
+    if root:
+        if start is None or end is None:
+            ctx.fail('Converting a dataset needs --start and --end')
+
+        try:
+            data = batch_data(
+                root, start, end, input_type, output_type, infile,
+                ext=ext, resolution=resolution, namemode=namemode, jobs=jobs, cache=cache,
+                **kws
+            )
+        except FileNotFoundError as e:
+            ctx.fail(str(e))
+
+    elif chunksize:
+        return stream_data(
+            src, dest, input_type, output_type, infile, outfile, chunksize, **kws
+        )
+
+    elif cache and isinstance(src, str):
+        data = convert_file(src, input_type, output_type, infile, cache=cache, **kws)
+
+    else:
+        # Read
+        data = read_data(src, input_type, infile, **kws)
+
+        # Convert financial data types
+        if input_type != output_type:
+            data = convert(data, input_type, output_type, **kws)
 
     # Write data
-    return write_data(dest, data, output_type, outfile, **kws)
+    for _, path, frame in _split_outputs(dest, data):
+        with _open_output(path) as f:
+            write_data(f, frame, output_type, outfile, **kws)
 
 
 if __name__ == "__main__":
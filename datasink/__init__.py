@@ -1 +1,3 @@
 from datasink.datasink import Datasink, stdout_logger
+from datasink.recordsink import RecordSink
+from datasink.reader import DatasetReader, merge_datasets
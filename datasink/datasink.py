@@ -1,12 +1,51 @@
 import io
 import os
+import time
+import queue
 import logging
+import tempfile
+import threading
+import contextlib
 from pathlib import Path
-from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 
 
 logger = logging.getLogger(__name__)
 
+# Sentinel asking the writer thread to drain and exit
+_STOP = object()
+
+
+def _period_start(t: datetime, resolution) -> datetime:
+    """Truncate a datetime to the start of its period at the resolution."""
+    if resolution == Datasink.MINUTE:
+        return t.replace(second=0, microsecond=0)
+    elif resolution == Datasink.HOUR:
+        return t.replace(minute=0, second=0, microsecond=0)
+    elif resolution == Datasink.DAY:
+        return t.replace(hour=0, minute=0, second=0, microsecond=0)
+    elif resolution == Datasink.MONTH:
+        return t.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError('Unrecognized resolution {}'.format(resolution))
+
+
+def _next_period(t: datetime, resolution) -> datetime:
+    """Return the start of the period following the one containing t."""
+    start = _period_start(t, resolution)
+
+    if resolution == Datasink.MINUTE:
+        return start + timedelta(minutes=1)
+    elif resolution == Datasink.HOUR:
+        return start + timedelta(hours=1)
+    elif resolution == Datasink.DAY:
+        # Go through the date so that DST transitions do not skew the result
+        return datetime.combine(start.date() + timedelta(days=1), start.time())
+    else:
+        if start.month == 12:
+            return start.replace(year=start.year + 1, month=1)
+        return start.replace(month=start.month + 1)
+
 
 class Datasink:
     """Data lake abstaction with time based file management.
@@ -55,8 +94,44 @@ class Datasink:
         Defaults to Datasink.DAY
     backend : str
         Defaults to OS file system. Valid values are 'os', 's3'
-    backend : dict
-        Custom configs to be passed to specified backend
+    backend_config : dict
+        Custom configs to be passed to specified backend. The S3 backend streams
+        files as multipart uploads from a background pool and accepts
+        'part_size' in bytes (default 8 MiB, minimum 5 MiB), 'spill_size' of
+        the in-memory buffer before it spills to disk (default 1 MiB),
+        'upload_workers' (default 2), 'max_inflight' parts or files before
+        writes block (default 4) and 'upload_retries' (default 3) on top of
+        AWS credentials
+    async_write : bool
+        Hand entries to a background writer thread instead of writing on the
+        calling thread. Defaults to False
+    queue_size : int
+        Maximum number of entries waiting for the writer thread. Writes block
+        when the queue is full
+    flush_bytes : int
+        Writer thread flushes once this many bytes are pending
+    flush_interval : float
+        Writer thread flushes at least this often, in seconds
+    compression : str
+        Stream output through a compression codec, 'gzip' or 'zstd'. The codec
+        suffix is appended to ext. Defaults to inferring the codec from ext,
+        i.e. ext='csv.gz' writes gzip files
+    max_bytes : int
+        Also rotate once a file holds this many bytes of uncompressed entries
+    max_records : int
+        Also rotate once a file holds this many entries
+    manifest : bool
+        Append an entry for every closed local file to a manifest in its
+        directory, recording the file name, the epoch times of its first and
+        last write, its entry count and its size on disk. Readers use it to
+        prune files by time range without opening them. Only the OS backend
+        keeps manifests
+
+    .. note:
+        With max_bytes or max_records set, every file name gets a zero padded
+        sequence suffix that restarts at each resolution boundary, i.e.
+        root/2018/11/30/08-0000.csv, root/2018/11/30/08-0001.csv. Existing
+        local files are skipped over instead of overwritten.
 
     """
 
@@ -70,6 +145,18 @@ class Datasink:
     OS = 'os'
     S3 = 's3'
 
+    # Per directory index of closed files
+    MANIFEST = '.manifest'
+
+    # Compression codecs
+    GZIP = 'gzip'
+    ZSTD = 'zstd'
+
+    _codecext = {
+        GZIP : 'gz',
+        ZSTD : 'zst'
+    }
+
     _dirfmt = {
         MINUTE : '%Y/%m/%d/%H/',
         HOUR   : '%Y/%m/%d/',
@@ -100,15 +187,47 @@ class Datasink:
             namemode=0,
             resolution=DAY,
             backend=OS,
-            backend_config={}
+            backend_config={},
+            async_write=False,
+            queue_size=65536,
+            flush_bytes=64 * 1024,
+            flush_interval=0.1,
+            compression=None,
+            max_bytes=None,
+            max_records=None,
+            manifest=False
         ):
+        if compression is None:
+            for codec, suffix in self._codecext.items():
+                if ext.endswith('.' + suffix):
+                    compression = codec
+        elif compression not in self._codecext:
+            raise ValueError('Unrecognized compression {}'.format(compression))
+        elif not ext.endswith('.' + self._codecext[compression]):
+            ext = '{}.{}'.format(ext, self._codecext[compression])
+
         self._res = resolution
         self._ext = ext
+        self._codec = compression
         self._header = header
         self._footer = footer
         self._mode = namemode
         self._backend = backend
 
+        self._sized = max_bytes is not None or max_records is not None
+        self._maxbytes = max_bytes or float('inf')
+        self._maxrecords = max_records or float('inf')
+        self._period = None
+        self._seq = 0
+        self._manifest = manifest and backend == self.OS
+
+        self._async = async_write
+        self._flush_bytes = flush_bytes
+        self._flush_interval = flush_interval
+        self._queue = None
+        self._writer = None
+        self._uploader = None
+
         if backend == self.OS:
             self._root = Path(root)
         elif backend == self.S3:
@@ -117,43 +236,154 @@ class Datasink:
             self._bucket = self._get_s3_bucket(pparts[0], backend_config)
             self._root   = Path('/'.join(pparts[1:]))
 
+            self._retries  = backend_config.get('upload_retries', 3)
+            self._partsize = max(backend_config.get('part_size', 8 * 2**20), 5 * 2**20)
+            self._spillsize = backend_config.get('spill_size', 2**20)
+            self._inflight = threading.BoundedSemaphore(backend_config.get('max_inflight', 4))
+            self._uploader = ThreadPoolExecutor(
+                max_workers=backend_config.get('upload_workers', 2),
+                thread_name_prefix='datasink-s3'
+            )
+
         self._newfile()
         self._addheader()
 
+        if async_write:
+            self._queue = queue.Queue(maxsize=queue_size)
+            self._writer = threading.Thread(target=self._writeforever, daemon=True)
+            self._writer.start()
+
     def write(self, msg):
         """Write entry to data sink."""
-        if self._getfullpath() != self._filepath:
-            self._nextfile()
+        if self._queue is not None:
+            # Entries belong to the period they were written in, however late
+            # the writer thread gets to them
+            self._queue.put((time.time(), msg))
+        else:
+            self._write(msg)
 
-        logger.debug('Writing data entry to {}.'.format(self._filepath))
+    def close(self):
+        """Close the datasink, draining pending writes and uploads."""
+        if self._writer is not None:
+            self._queue.put(_STOP)
+            self._writer.join()
+            self._writer = None
+            self._queue = None
 
-        self._file.write(msg + '\n')
+        self._closefile()
 
-    def close(self):
-        """Close the datasink."""
+        if self._uploader is not None:
+            self._uploader.shutdown(wait=True)
+            self._uploader = None
+
+    def _write(self, msg, now=None):
+        self._rotate(now)
+
+        logger.debug('Writing data entry to {}.'.format(self._filepath))
 
+        self._file.write(msg + '\n')
+        self._records += 1
+        self._bytes += len(msg) + 1
+
+    def _rotate(self, now=None):
+        """Rotate to the next file when the current one is due at time now."""
+        if now is None:
+            now = time.time()
+
+        # Rotation deadline is precomputed when a file opens
+        if now >= self._deadline:
+            self._nextfile(now)
+        elif self._sized and (self._records >= self._maxrecords
+                              or self._bytes >= self._maxbytes):
+            self._nextfile(now)
+
+        if self._first is None:
+            self._first = now
+        self._last = now
+
+    def _writeforever(self):
+        """Writer thread loop batching queued entries into periodic flushes."""
+        pending  = []
+        size     = 0
+        deadline = time.monotonic() + self._flush_interval
+
+        while True:
+            try:
+                msg = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                pass
+            else:
+                if msg is _STOP:
+                    self._flush(pending)
+                    return
+                pending.append(msg)
+                size += self._entrysize(msg[1])
+
+            if size >= self._flush_bytes or time.monotonic() >= deadline:
+                self._flush(pending)
+                pending  = []
+                size     = 0
+                deadline = time.monotonic() + self._flush_interval
+
+    def _entrysize(self, msg):
+        """Bytes an entry adds towards flush_bytes."""
+        return len(msg) + 1
+
+    def _flush(self, pending):
+        if not pending:
+            return
+
+        try:
+            for now, msg in pending:
+                self._write(msg, now)
+            self._file.flush()
+        except Exception:
+            logger.exception('Writer thread failed to flush {} entries'.format(len(pending)))
+
+    def _closefile(self):
         # Close local file
         if self._backend == Datasink.OS:
             self._file.close()
             logger.info('Close local file')
 
-        # Write buffer to S3 object
+            if self._manifest:
+                self._addmanifest()
+
+        # Closing the stream uploads the last part from the background pool
         elif self._backend == Datasink.S3:
-            self._obj.put(Body=bytes(self._file.getvalue(), 'utf8'))
+            self._raw.complete = True
             self._file.close()
-            logger.info('Sent file to AWS S3')
-
-    def _nextfile(self):
+            self._raw.close()
+            logger.info('Queued {} for upload to AWS S3'.format(self._filepath))
+
+    def _addmanifest(self):
+        """Append the entry of the closed file to its directory manifest."""
+        p = self._filepath
+        entry = '{},{},{},{},{}\n'.format(
+            p.name,
+            '' if self._first is None else repr(self._first),
+            '' if self._last is None else repr(self._last),
+            self._records,
+            p.stat().st_size
+        )
+        with open(p.parent / self.MANIFEST, 'a') as f:
+            f.write(entry)
+
+    def _nextfile(self, now=None):
         self._addfooter()
-        self.close()
+        self._closefile()
         logger.info('Rotating to next file')
-        self._newfile()
+        self._newfile(now)
         self._addheader()
 
-    def _getfullpath(self):
-        """Return approperiate file Path determined by current time."""
+    def _getfullpath(self, time=None, seq=0):
+        """Return approperiate file Path determined by time, defaults to now.
+
+        The sequence number is only part of the name with size based rotation.
+        """
 
-        time = datetime.now()
+        if time is None:
+            time = datetime.now()
 
         # root/2018/11/30/08.csv
         if self._mode == 0:
@@ -174,13 +404,34 @@ class Datasink:
         else:
             raise ValueError('Unrecognized file naming operation')
 
+        # root/2018/11/30/08-0001.csv
+        if self._sized:
+            subpath = '{}-{:04d}'.format(subpath, seq)
+
         return self._root / '{}.{}'.format(subpath, self._ext)
 
-    def _newfile(self):
-        """Rotate to a new IO object as the sink buffer."""
-        self._filepath = p = self._getfullpath()
+    def _newfile(self, now=None):
+        """Rotate to a new IO object as the sink buffer for epoch time now."""
+        now = datetime.now() if now is None else datetime.fromtimestamp(now)
+        period = _period_start(now, self._res)
+
+        # Sequence restarts at every resolution boundary
+        self._seq = self._seq + 1 if period == self._period else 0
+        self._period = period
+
+        p = self._getfullpath(now, self._seq)
+        if self._sized:
+            while self._exists(p):
+                self._seq += 1
+                p = self._getfullpath(now, self._seq)
+
+        self._filepath = p
+        self._deadline = _next_period(now, self._res).timestamp()
+        self._records = 0
+        self._bytes = 0
+        self._first = None
+        self._last = None
 
-        # Open new local file
         if self._backend == Datasink.OS:
             # Prevent ovewriting existing files
             if p.exists():
@@ -188,23 +439,71 @@ class Datasink:
 
             p.parent.mkdir(mode=0o775, parents=True, exist_ok=True)
 
-            # line buffering, assuming each write will be a line
-            self._file = p.open(mode='w', buffering=1)
+        self._openfile(p)
+
+    def _openfile(self, p):
+        """Open the sink buffer for the file at path p."""
+        # Open new local file
+        if self._backend == Datasink.OS:
+            # line buffering, assuming each write will be a line, unless the
+            # writer thread batches entries into larger flushes. Compressed
+            # streams are never line buffered, a flush per line would wreck
+            # the compression ratio.
+            if self._codec:
+                self._file = self._open_codec(p)
+            elif not self._async:
+                self._file = p.open(mode='w', buffering=1)
+            else:
+                self._file = p.open(mode='w', buffering=self._flush_bytes)
             logger.info('Create local file {}'.format(p))
 
         # Create new buffer for S3 object
         elif self._backend == Datasink.S3:
-            self._file = io.StringIO()
-            self._obj = self._bucket.Object(str(p))
+            self._openobj(p)
+            if self._codec:
+                self._file = self._open_codec(self._raw)
+            else:
+                self._file = io.TextIOWrapper(io.BufferedWriter(self._raw), encoding='utf8')
             logger.info('Create IO object {} as buffer for S3'.format(p))
 
+    def _exists(self, p):
+        """Whether a file or object already sits at path p."""
+        if self._backend == Datasink.S3:
+            return any(o.key == str(p) for o in
+                       self._bucket.objects.filter(Prefix=str(p)))
+        return p.exists()
+
+    def _openobj(self, p):
+        """Create the S3 object and the binary stream uploading to it."""
+        self._obj = self._bucket.Object(str(p))
+        self._raw = _S3Stream(
+            self._obj,
+            self._uploader,
+            self._inflight,
+            self._retries,
+            self._partsize,
+            self._spillsize
+        )
+
     def _addheader(self):
         if self._header:
             self._file.write(self._header + '\n')
 
     def _addfooter(self):
         if self._footer:
-            self._file._write(self._footer + '\n')
+            self._file.write(self._footer + '\n')
+
+    def _open_codec(self, file):
+        """Open a text stream writing through the compression codec.
+
+        File objects are left open when the codec stream is closed.
+        """
+        if self._codec == Datasink.GZIP:
+            import gzip
+            return gzip.open(file, mode='wt', encoding='utf8')
+        elif self._codec == Datasink.ZSTD:
+            import zstandard
+            return zstandard.open(file, mode='wt', encoding='utf8', closefd=False)
 
     def _get_s3_bucket(self, bucket, config):
         import boto3
@@ -225,6 +524,147 @@ class Datasink:
             return boto3.resource('s3').Bucket(bucket)
 
 
+def _retry(func, retries, what):
+    """Call func, retrying with exponential backoff when it raises."""
+    for attempt in range(retries + 1):
+        try:
+            return func()
+        except Exception as e:
+            if attempt == retries:
+                raise
+            logger.warning('{} failed: {}. Retrying'.format(what, e))
+            time.sleep(2 ** attempt)
+
+
+class _S3Stream(io.RawIOBase):
+    """Writable binary stream uploading to an S3 object in the background.
+
+    Written bytes accumulate in a spooled temporary file which moves to disk
+    past spill_size. Every part_size bytes the buffer is handed to the upload
+    pool as a multipart upload part, so memory use is bounded by a few part
+    sizes regardless of file length. Objects smaller than a single part are
+    uploaded with a plain put on close.
+
+    Only streams marked complete by their sink are uploaded on close. A
+    stream closed without it, e.g. when garbage collected along with an
+    unclosed sink, is discarded instead of publishing a partial object.
+    """
+
+    def __init__(self, obj, pool, inflight, retries, part_size, spill_size):
+        self._obj = obj
+        self._pool = pool
+        self._inflight = inflight
+        self._retries = retries
+        self._partsize = part_size
+        self._spillsize = spill_size
+
+        self._buf = tempfile.SpooledTemporaryFile(max_size=spill_size)
+        self._size = 0
+
+        self._mpu = None
+        self._parts = []
+
+        self.complete = False
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        n = self._buf.write(b)
+        self._size += n
+        if self._size >= self._partsize:
+            self._sendpart()
+        return n
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if not self.complete:
+                self._discard()
+            elif self._mpu is None:
+                self._submit(self._put, self._take())
+            else:
+                if self._size:
+                    self._sendpart()
+                self._pool.submit(self._complete, self._mpu, list(self._parts))
+        finally:
+            super().close()
+
+    def _discard(self):
+        logger.warning('Discarding unfinished upload of {}'.format(self._obj.key))
+        self._buf.close()
+        if self._mpu is not None:
+            with contextlib.suppress(Exception):
+                self._pool.submit(lambda mpu: mpu.result().abort(), self._mpu)
+
+    def _take(self):
+        """Return the buffered bytes and start a fresh buffer."""
+        self._buf.seek(0)
+        data = self._buf.read()
+        self._buf.close()
+        self._buf = tempfile.SpooledTemporaryFile(max_size=self._spillsize)
+        self._size = 0
+        return data
+
+    def _submit(self, func, *args):
+        # Block the writer when too many buffers are waiting for the network
+        self._inflight.acquire()
+        try:
+            future = self._pool.submit(self._release_after, func, *args)
+        except Exception:
+            self._inflight.release()
+            raise
+        return future
+
+    def _release_after(self, func, *args):
+        try:
+            return func(*args)
+        finally:
+            self._inflight.release()
+
+    def _sendpart(self):
+        if self._mpu is None:
+            self._mpu = self._pool.submit(
+                _retry,
+                self._obj.initiate_multipart_upload,
+                self._retries,
+                'Multipart upload of {}'.format(self._obj.key)
+            )
+        number = len(self._parts) + 1
+        self._parts.append(self._submit(self._putpart, self._mpu, number, self._take()))
+
+    def _put(self, data):
+        try:
+            _retry(lambda: self._obj.put(Body=data), self._retries,
+                   'Upload of {}'.format(self._obj.key))
+            logger.info('Sent file {} to AWS S3'.format(self._obj.key))
+        except Exception:
+            logger.exception('Giving up upload of {}'.format(self._obj.key))
+
+    def _putpart(self, mpu, number, data):
+        part = mpu.result().Part(number)
+        res = _retry(lambda: part.upload(Body=data), self._retries,
+                     'Upload of part {} of {}'.format(number, self._obj.key))
+        return {'PartNumber': number, 'ETag': res['ETag']}
+
+    def _complete(self, mpu, parts):
+        try:
+            mpu = mpu.result()
+        except Exception:
+            logger.exception('Giving up upload of {}'.format(self._obj.key))
+            return
+
+        try:
+            parts = [part.result() for part in parts]
+            _retry(lambda: mpu.complete(MultipartUpload={'Parts': parts}), self._retries,
+                   'Completing upload of {}'.format(self._obj.key))
+            logger.info('Sent file {} to AWS S3'.format(self._obj.key))
+        except Exception:
+            logger.exception('Giving up upload of {}'.format(self._obj.key))
+            mpu.abort()
+
+
 def stdout_logger(level=logging.INFO, formatter=None):
     handler = logging.StreamHandler()
     handler.setLevel(level)
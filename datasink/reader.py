@@ -0,0 +1,410 @@
+import time
+import logging
+from pathlib import Path
+from datetime import datetime
+from collections import namedtuple
+
+from datasink.datasink import Datasink, _period_start, _next_period
+
+
+logger = logging.getLogger(__name__)
+
+
+# Entry of a directory manifest, times are epoch seconds of first and last write
+ManifestEntry = namedtuple('ManifestEntry', ['name', 'first', 'last', 'records', 'size'])
+
+
+def read_manifest(directory):
+    """Return the manifest entries of a dataset directory keyed by file name."""
+    entries = {}
+    try:
+        with open(Path(directory) / Datasink.MANIFEST) as f:
+            for line in f:
+                name, first, last, records, size = line.rstrip('\n').split(',')
+                entries[name] = ManifestEntry(
+                    name,
+                    float(first) if first else None,
+                    float(last) if last else None,
+                    int(records),
+                    int(size)
+                )
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def _open_text(path):
+    """Open a data file for reading text, decompressing by its extension."""
+    name = str(path)
+    if name.endswith('.gz'):
+        import gzip
+        return gzip.open(path, mode='rt', encoding='utf8')
+    elif name.endswith('.zst'):
+        import zstandard
+        return zstandard.open(path, mode='rt', encoding='utf8')
+    return open(path, encoding='utf8')
+
+
+class DatasetReader:
+    """Time range reader over the directory layout written by Datasink.
+
+    File paths are computed from the resolution and naming mode for every
+    period in [start, end), so reading a range never walks the dataset tree.
+    Only naming mode 1, whose file names are opening timestamps, and size
+    rotated datasets need a listing of the single directory of each period.
+    Files are yielded lazily in time order.
+
+    Times are naive local datetimes, matching the clock Datasink names files
+    by. Only local datasets are supported.
+
+    Directories carrying a Datasink manifest are pruned further: files whose
+    recorded write times fall outside the range are skipped without being
+    opened, and estimate() sums the manifests instead of reading any files.
+
+    Args
+    ----
+    root : str
+        Path to data directory, as passed to Datasink
+    start : datetime
+        Start of the time range, inclusive
+    end : datetime
+        End of the time range, exclusive
+    ext : str
+        File extension of each file
+    resolution : str
+        Resolution the dataset was written with. Defaults to Datasink.DAY
+    namemode : int
+        File naming mode the dataset was written with
+    sequenced : bool
+        Whether the dataset was written with size based rotation
+    header : bool
+        Whether each file starts with a header line
+
+    """
+
+    def __init__(
+            self,
+            root,
+            start,
+            end,
+            ext='csv',
+            resolution=Datasink.DAY,
+            namemode=0,
+            sequenced=False,
+            header=False
+        ):
+        self._root = Path(root)
+        self._start = start
+        self._end = end
+        self._ext = ext
+        self._res = resolution
+        self._mode = namemode
+        self._sequenced = sequenced
+        self._header = header
+        self._manifests = {}
+        self.columns = None
+
+    def periods(self):
+        """Yield the start of every period overlapping the time range."""
+        t = _period_start(self._start, self._res)
+        while t < self._end:
+            yield t
+            t = _next_period(t, self._res)
+
+    def paths(self, t):
+        """Return the existing files of the period starting at t, in order."""
+        dirfmt = Datasink._dirfmt[self._res]
+
+        # root/2018/11/20181130/1501231921.csv
+        if self._mode == 1:
+            parent = self._root / t.strftime(dirfmt + Datasink._fullfmt[self._res])
+            if not parent.is_dir():
+                return []
+            return sorted(parent.glob('*.' + self._ext), key=self._timestamp_key)
+
+        if self._mode == 0:
+            stem = t.strftime(dirfmt + Datasink._filefmt[self._res])
+        elif self._mode == 2:
+            stem = t.strftime(dirfmt + Datasink._fullfmt[self._res])
+        else:
+            raise ValueError('Unrecognized file naming operation')
+
+        # root/2018/11/30/08-0001.csv
+        if self._sequenced:
+            path = self._root / stem
+            return sorted(path.parent.glob('{}-*.{}'.format(path.name, self._ext)))
+
+        path = self._root / '{}.{}'.format(stem, self._ext)
+        return [path] if path.exists() else []
+
+    def files(self):
+        """Yield every existing file in the time range in time order."""
+        lo = self._start.timestamp()
+        hi = self._end.timestamp()
+
+        for t in self.periods():
+            for path in self.paths(t):
+                entry = self.entry(path)
+                if entry and entry.first is not None \
+                        and (entry.last < lo or entry.first >= hi):
+                    continue
+                yield path
+
+    def entry(self, path):
+        """Return the manifest entry of a file, None if it is not indexed."""
+        parent = path.parent
+        if parent not in self._manifests:
+            # Only directories of the range are ever read, keep the latest
+            self._manifests = {parent: read_manifest(parent)}
+        return self._manifests[parent].get(path.name)
+
+    def estimate(self):
+        """Return the number of entries and bytes in the range.
+
+        Only files indexed in a manifest are counted, the file currently being
+        written is not indexed until it is closed.
+        """
+        records = size = 0
+        for path in self.files():
+            entry = self.entry(path)
+            if entry:
+                records += entry.records
+                size += entry.size
+        return records, size
+
+    def records(self):
+        """Yield every entry in the time range as a string, without newline."""
+        for path in self.files():
+            with _open_text(path) as f:
+                if self._header:
+                    f.readline()
+                for line in f:
+                    yield line.rstrip('\n')
+
+    def chunks(self, chunksize=None, **kwargs):
+        """Yield the time range as DataFrames, one or more per file.
+
+        Keyword arguments are passed to the pandas reader of the file format,
+        e.g. names or usecols for CSV files.
+        """
+        import pandas as pd
+
+        fmt = self._ext.split('.')[0]
+        for path in self.files():
+            logger.debug('Reading {}'.format(path))
+
+            if fmt == 'csv':
+                header = 0 if self._header else None
+                data = pd.read_csv(path, header=header, chunksize=chunksize, **kwargs)
+            elif fmt == 'json':
+                data = pd.read_json(
+                    path, lines=True, convert_dates=False, chunksize=chunksize, **kwargs
+                )
+            elif fmt == 'parquet':
+                data = pd.read_parquet(path, **kwargs)
+            elif fmt == 'arrow':
+                import pyarrow as pa
+                data = pa.ipc.open_file(path).read_pandas(**kwargs)
+            else:
+                raise ValueError('Unrecognized file format {}'.format(self._ext))
+
+            if isinstance(data, pd.DataFrame):
+                yield data
+            else:
+                with data:
+                    yield from data
+
+    def follow(self, poll=0.2, tail=True):
+        """Yield entries as they are appended to the dataset, without end.
+
+        Starts at the latest file of the periods from start until now, and
+        moves on to the next file once Datasink rotates to it. Entries are
+        yielded without newline, and None is yielded whenever no new entry
+        arrived within poll seconds, so callers can act on idle time. With a
+        header, the column names of the file being read are kept in columns.
+
+        Only uncompressed files can be followed, and entries only show up
+        once the writer flushes them, e.g. a Datasink with async_write.
+
+        Args
+        ----
+        poll : float
+            Seconds to wait for new entries before checking again
+        tail : bool
+            Skip the entries already in the first file
+
+        """
+        if self._ext.endswith(('.gz', '.zst')):
+            raise ValueError('Cannot follow compressed files')
+
+        found = self._latest(self._start)
+        while found is None:
+            # Files created while waiting are new from their first entry
+            tail = False
+            yield None
+            time.sleep(poll)
+            found = self._latest(self._start)
+
+        period, path = found
+        f = open(path, encoding='utf8')
+        header = self._header
+        if tail:
+            if header:
+                self.columns = f.readline().rstrip('\n').split(',')
+                header = False
+            f.seek(0, 2)
+
+        partial = ''
+        try:
+            while True:
+                line = f.readline()
+                if line:
+                    # Lines may be read while the writer is halfway through
+                    if not line.endswith('\n'):
+                        partial += line
+                        continue
+                    line, partial = (partial + line).rstrip('\n'), ''
+                    if header:
+                        self.columns = line.split(',')
+                        header = False
+                    else:
+                        yield line
+                    continue
+
+                # Only switch once the current file is drained
+                period, latest = self._latest(period)
+                if latest != path:
+                    # Datasink closes a file before opening the next, so
+                    # anything flushed since the last read is in by now
+                    for line in (partial + f.read()).split('\n'):
+                        if line and not header:
+                            yield line
+                        header = False
+                    logger.debug('Following {}'.format(latest))
+                    f.close()
+                    path, partial, header = latest, '', self._header
+                    f = open(path, encoding='utf8')
+                    continue
+
+                yield None
+                time.sleep(poll)
+        finally:
+            f.close()
+
+    def _latest(self, since):
+        """Return the period and path of the latest file from since until now."""
+        latest = None
+        now = datetime.now()
+        t = _period_start(since, self._res)
+        while t <= now:
+            paths = self.paths(t)
+            if paths:
+                latest = t, paths[-1]
+            t = _next_period(t, self._res)
+        return latest
+
+    @staticmethod
+    def _timestamp_key(path):
+        stem = path.name.split('.')[0]
+        ts, _, seq = stem.partition('-')
+        return int(ts), seq
+
+
+def merge_chunks(streams, key, tag='pair'):
+    """Merge time ordered DataFrame streams into a single time ordered stream.
+
+    A heap holds the last key of the chunk buffered from each stream. Every
+    row up to the smallest of those keys is final, since no stream can yield
+    an earlier row afterwards, so it is cut from all buffers, sorted and
+    yielded at once. The streams holding that smallest key are then refilled.
+    Only one chunk per stream is held in memory at a time. Rows of a stream
+    keep their order, and rows with equal keys yielded in the same chunk are
+    in the order of the streams.
+
+    Args
+    ----
+    streams : dict
+        Iterables of DataFrames keyed by a tag, each sorted by key
+    key : str
+        Column the streams are sorted by
+    tag : str
+        Name of the column added to every row to tell the stream it came from
+
+    """
+    import heapq
+    import pandas as pd
+
+    iters   = {name: iter(chunks) for name, chunks in streams.items()}
+    order   = {name: i for i, name in enumerate(streams)}
+    buffers = {}
+    heap    = []
+
+    def _refill(name):
+        for chunk in iters[name]:
+            if not chunk.empty:
+                buffers[name] = chunk
+                heapq.heappush(heap, (chunk[key].iloc[-1], order[name], name))
+                return
+        buffers.pop(name, None)
+
+    for name in streams:
+        _refill(name)
+
+    while heap:
+        cut = heap[0][0]
+
+        parts = []
+        for name in streams:
+            if name not in buffers:
+                continue
+            chunk = buffers[name]
+            n = int(chunk[key].searchsorted(cut, side='right'))
+            if n:
+                parts.append(chunk.iloc[:n].assign(**{tag: name}))
+                buffers[name] = chunk.iloc[n:]
+
+        merged = pd.concat(parts, ignore_index=True)
+        yield merged.sort_values(key, kind='mergesort', ignore_index=True)
+
+        # Streams whose last key was the cut are drained
+        while heap and heap[0][0] <= cut:
+            _, _, name = heapq.heappop(heap)
+            _refill(name)
+
+
+def merge_datasets(roots, start, end, key='timestamp', chunksize=100000, tag='pair', **kwargs):
+    """Merge the time range of several datasets into one time ordered stream.
+
+    Args
+    ----
+    roots : list or dict
+        Dataset roots, or roots keyed by tag. Listed roots are tagged by the
+        part of their name after the last dash, e.g. the pair of
+        bitstamp-tick-btcusd
+    start : datetime
+        Start of the time range, inclusive
+    end : datetime
+        End of the time range, exclusive
+    key : str
+        Column every dataset is sorted by
+    chunksize : int
+        Number of rows read from each dataset at a time
+    tag : str
+        Name of the column holding the tag of each row
+    **kwargs
+        ext, resolution, namemode, sequenced and header of the datasets, plus
+        pandas reader options such as names
+
+    """
+    if not isinstance(roots, dict):
+        roots = {str(root).rstrip('/').rsplit('-', 1)[-1]: root for root in roots}
+
+    options = {
+        k: kwargs.pop(k) for k in ('ext', 'resolution', 'namemode', 'sequenced', 'header')
+            if k in kwargs
+    }
+    streams = {
+        name: DatasetReader(root, start, end, **options).chunks(chunksize, **kwargs)
+            for name, root in roots.items()
+    }
+    return merge_chunks(streams, key, tag=tag)
@@ -2,7 +2,7 @@ import os
 import time
 import shutil
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta
 
 import pytest
 
@@ -96,14 +96,41 @@ def test_headers():
     shutil.rmtree(root)
 
 def test_s3_buffer():
+    boto3 = pytest.importorskip('boto3')
+    moto  = pytest.importorskip('moto')
+
     root    = 'bucket/__test'
     backend = Datasink.S3
     teststr = 'hello world'
 
-    sink = Datasink(root=root, ext=ext, backend=backend)
-    sink.write(teststr)
+    with moto.mock_aws():
+        os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+        boto3.resource('s3').create_bucket(Bucket='bucket')
+
+        sink = Datasink(root=root, ext=ext, backend=backend)
+        sink.write(teststr)
+        sink._file.flush()
+
+        sink._raw._buf.seek(0)
+        assert sink._raw._buf.read() == bytes(teststr + '\n', 'utf8')
+        sink.close()
+
+
+def test_s3_discard_unclosed():
+    boto3 = pytest.importorskip('boto3')
+    moto  = pytest.importorskip('moto')
+
+    with moto.mock_aws():
+        os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+        boto3.resource('s3').create_bucket(Bucket='bucket')
 
-    assert sink._file.getvalue() == teststr + '\n'
+        sink = Datasink('bucket/__test', backend=Datasink.S3)
+        sink.write('partial')
+
+        # Streams closed without their sink, as on garbage collection, are dropped
+        sink._file.close()
+        sink._uploader.shutdown(wait=True)
+        assert list(boto3.resource('s3').Bucket('bucket').objects.all()) == []
 
 
 def test_mode_0():
@@ -134,3 +161,314 @@ def test_mode_1():
 
     del sink
     shutil.rmtree(root)
+
+
+def test_async_write():
+    entries = ['entry {}'.format(i) for i in range(1000)]
+    sink = Datasink(root, async_write=True, flush_bytes=1024)
+    for entry in entries:
+        sink.write(entry)
+    f = str(sink._filepath)
+    sink.close()
+
+    assert open(f).read() == ''.join(e + '\n' for e in entries)
+
+    del sink
+    shutil.rmtree(root)
+
+
+def test_rotate_on_deadline():
+    sink = Datasink(root, resolution=Datasink.MINUTE, namemode=1)
+    sink.write('first')
+    first = sink._filepath
+
+    # Pretend the rotation boundary has passed
+    time.sleep(1)
+    sink._deadline = 0
+    sink.write('second')
+    second = sink._filepath
+    sink.close()
+
+    assert first != second
+    assert sink._deadline > time.time()
+    assert open(str(first)).read() == 'first\n'
+    assert open(str(second)).read() == 'second\n'
+
+    shutil.rmtree(root)
+
+
+def test_gzip_rotation():
+    import gzip
+
+    sink = Datasink(root, header='header', compression=Datasink.GZIP, namemode=1)
+    sink.write('first')
+    first = str(sink._filepath)
+
+    time.sleep(1)
+    sink._deadline = 0
+    sink.write('second')
+    second = str(sink._filepath)
+    sink.close()
+
+    # Each rotated file is a complete archive on its own
+    assert first.endswith('.csv.gz')
+    assert gzip.open(first, 'rt').read() == 'header\nfirst\n'
+    assert gzip.open(second, 'rt').read() == 'header\nsecond\n'
+
+    shutil.rmtree(root)
+
+
+def test_s3_upload_on_rotation():
+    boto3 = pytest.importorskip('boto3')
+    moto  = pytest.importorskip('moto')
+
+    with moto.mock_aws():
+        os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+        boto3.resource('s3').create_bucket(Bucket='bucket')
+
+        sink = Datasink('bucket/__test', backend=Datasink.S3, namemode=1)
+        sink.write('first')
+        first = str(sink._filepath)
+
+        time.sleep(1)
+        sink._deadline = 0
+        sink.write('second')
+        second = str(sink._filepath)
+        sink.close()
+
+        bucket = boto3.resource('s3').Bucket('bucket')
+        assert bucket.Object(first).get()['Body'].read() == b'first\n'
+        assert bucket.Object(second).get()['Body'].read() == b'second\n'
+
+
+def test_s3_no_overwrite_on_restart():
+    boto3 = pytest.importorskip('boto3')
+    moto  = pytest.importorskip('moto')
+
+    with moto.mock_aws():
+        os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+        boto3.resource('s3').create_bucket(Bucket='bucket')
+
+        # A restarted collector within the same period picks the next sequence
+        keys = []
+        for entry in ('first', 'second'):
+            sink = Datasink('bucket/__test', backend=Datasink.S3, max_records=10)
+            sink.write(entry)
+            keys.append(str(sink._filepath))
+            sink.close()
+
+        assert keys[0] != keys[1]
+        bucket = boto3.resource('s3').Bucket('bucket')
+        assert bucket.Object(keys[0]).get()['Body'].read() == b'first\n'
+        assert bucket.Object(keys[1]).get()['Body'].read() == b'second\n'
+
+
+def test_s3_multipart_upload():
+    boto3 = pytest.importorskip('boto3')
+    moto  = pytest.importorskip('moto')
+
+    part  = 5 * 2**20
+    entry = 'x' * 1023
+
+    with moto.mock_aws():
+        os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+        boto3.resource('s3').create_bucket(Bucket='bucket')
+
+        config = {'part_size': part, 'spill_size': 2**16}
+        sink = Datasink('bucket/__test', backend=Datasink.S3, backend_config=config)
+        for _ in range(2 * part // 1024 + 10):
+            sink.write(entry)
+        key = str(sink._filepath)
+
+        # Full parts were already handed to the uploader
+        assert len(sink._raw._parts) == 2
+        sink.close()
+
+        body = boto3.resource('s3').Bucket('bucket').Object(key).get()['Body'].read()
+        assert body == bytes(entry + '\n', 'utf8') * (2 * part // 1024 + 10)
+
+
+def test_rotate_on_max_records():
+    sink = Datasink(root, max_records=2)
+    for i in range(5):
+        sink.write(str(i))
+    sink.close()
+
+    files = sorted(Path(root).glob('**/*.csv'))
+    assert [f.name[-9:] for f in files] == ['-0000.csv', '-0001.csv', '-0002.csv']
+    assert [f.read_text() for f in files] == ['0\n1\n', '2\n3\n', '4\n']
+
+    # Restarting within the period continues the sequence
+    sink = Datasink(root, max_records=2)
+    sink.write('5')
+    sink.close()
+    assert str(sink._filepath).endswith('-0003.csv')
+
+    shutil.rmtree(root)
+
+
+def test_record_sink_parquet():
+    pq = pytest.importorskip('pyarrow.parquet')
+    from datasink import RecordSink
+
+    schema = [('id', 'int64'), ('price', 'float64')]
+    sink = RecordSink(root, schema=schema, row_group_size=4)
+    for i in range(10):
+        sink.write((i, i / 2))
+    f = str(sink._filepath)
+    sink.close()
+
+    assert f.endswith('.parquet')
+    assert pq.ParquetFile(f).metadata.num_row_groups == 3
+    assert pq.read_table(f, columns=['price']).column('price').to_pylist()[-1] == 4.5
+
+    shutil.rmtree(root)
+
+
+def test_record_sink_async_flush_counts_records():
+    pq = pytest.importorskip('pyarrow.parquet')
+    from datasink import RecordSink
+
+    schema = [('id', 'int64'), ('name', 'string')]
+    sink = RecordSink(root, schema=schema, async_write=True, flush_bytes=3,
+                      flush_interval=60)
+    assert sink._entrysize((1, 'a long name')) == 1
+    for i in range(7):
+        sink.write((i, str(i)))
+    f = str(sink._filepath)
+    sink.close()
+
+    assert pq.read_table(f).column('id').to_pylist() == list(range(7))
+
+    shutil.rmtree(root)
+
+
+def test_dataset_reader():
+    from datasink import DatasetReader
+
+    for mode in (0, 1, 2):
+        sink = Datasink(root, header='a,b', namemode=mode, resolution=Datasink.MINUTE)
+        sink.write('1,2')
+        sink.write('3,4')
+        sink.close()
+
+        now    = datetime.now()
+        reader = DatasetReader(
+            root,
+            start=now - timedelta(minutes=1),
+            end=now + timedelta(minutes=1),
+            resolution=Datasink.MINUTE,
+            namemode=mode,
+            header=True
+        )
+        assert list(reader.files()) == [sink._filepath]
+        assert list(reader.records()) == ['1,2', '3,4']
+        assert next(reader.chunks()).b.sum() == 6
+
+        shutil.rmtree(root)
+
+
+def test_manifest():
+    from datasink import DatasetReader
+    from datasink.reader import read_manifest
+
+    sink = Datasink(root, manifest=True, max_records=2)
+    for i in range(3):
+        sink.write(str(i))
+    sink.close()
+
+    entries = read_manifest(sink._filepath.parent)
+    assert [e.records for e in entries.values()] == [2, 1]
+    assert all(e.first <= e.last for e in entries.values())
+
+    now = datetime.now()
+    reader = DatasetReader(root, now - timedelta(days=1), now + timedelta(days=1), sequenced=True)
+    assert reader.estimate()[0] == 3
+
+    # Files written entirely before the range are pruned
+    reader = DatasetReader(root, now + timedelta(seconds=1), now + timedelta(days=1), sequenced=True)
+    assert list(reader.files()) == []
+
+    shutil.rmtree(root)
+
+
+def test_follow_rotation():
+    from itertools import islice
+    from datasink import DatasetReader
+
+    sink = Datasink(root, header='a,b', namemode=1, resolution=Datasink.MINUTE)
+    sink.write('1,2')
+    sink._file.flush()
+
+    reader = DatasetReader(root, datetime.now(), None, resolution=Datasink.MINUTE,
+                           namemode=1, header=True)
+    entries = reader.follow(poll=0.01, tail=False)
+    assert next(entries) == '1,2'
+    assert reader.columns == ['a', 'b']
+    assert next(entries) is None
+
+    # Rotated files are picked up once the previous one is drained
+    time.sleep(1)
+    sink.write('3,4')
+    sink._deadline = 0
+    sink.write('5,6')
+    sink._file.flush()
+    assert [e for e in islice(entries, 4) if e] == ['3,4', '5,6']
+
+    sink.close()
+    shutil.rmtree(root)
+
+
+def test_merge_datasets():
+    import pandas as pd
+    from datasink import merge_datasets
+    from datasink.reader import merge_chunks
+
+    streams = {
+        'a': [pd.DataFrame({'t': [1, 4]}), pd.DataFrame({'t': [4, 9]})],
+        'b': [pd.DataFrame({'t': [2, 3, 4]}), pd.DataFrame({'t': [8]})],
+        'c': [],
+    }
+    merged = pd.concat(merge_chunks(streams, 't'), ignore_index=True)
+    assert list(merged.t) == [1, 2, 3, 4, 4, 4, 8, 9]
+    assert list(merged.pair) == ['a', 'b', 'b', 'a', 'b', 'a', 'b', 'a']
+
+    roots = ['{}-{}'.format(root, pair) for pair in ('btcusd', 'ethusd')]
+    for i, r in enumerate(roots):
+        sink = Datasink(r, header='timestamp,price')
+        for t in range(3):
+            sink.write('{},{}'.format(2 * t + i, i))
+        sink.close()
+
+    now = datetime.now()
+    merged = pd.concat(merge_datasets(roots, now - timedelta(days=1), now + timedelta(days=1),
+                                      header=True, chunksize=2))
+    assert list(merged.timestamp) == list(range(6))
+    assert list(merged.pair) == ['btcusd', 'ethusd'] * 3
+
+    for r in roots:
+        shutil.rmtree(r)
+
+
+def test_async_rotates_on_write_time(monkeypatch):
+    import datasink.datasink as module
+
+    sink = Datasink(root, async_write=True, namemode=1, resolution=Datasink.MINUTE,
+                    flush_interval=60)
+    first    = sink._filepath
+    deadline = sink._deadline
+
+    # Entries are queued on either side of the boundary before the writer
+    # thread gets to them
+    clock = iter([deadline - 1, deadline + 1])
+    monkeypatch.setattr(module.time, 'time', lambda: next(clock))
+    sink.write('before')
+    sink.write('after')
+    monkeypatch.undo()
+    sink.close()
+
+    assert open(str(first)).read() == 'before\n'
+    assert open(str(sink._filepath)).read() == 'after\n'
+    assert sink._filepath != first
+
+    shutil.rmtree(root)
@@ -2,10 +2,13 @@ import os
 import sys
 import json
 import time
+import zlib
 import socket
 import logging
 import traceback
 from enum import Enum
+from decimal import Decimal
+from bisect import bisect_left, insort
 from threading import Thread
 
 import websocket as ws
@@ -16,6 +19,14 @@ from .exception import *
 _log = logging.getLogger(__name__)
 WSSURL = 'wss://api.bitfinex.com/ws/2'
 
+# Configuration flag to receive order book checksums
+FLAG_CHECKSUM = 131072
+
+# Book subscription defaults
+BOOK_PREC = 'P0'
+BOOK_FREQ = 'F0'
+BOOK_LEN  = '25'
+
 
 def decode_evt(evt):
     """Parse string repr of market event into dict repr with named keys for bitfinex."""
@@ -28,9 +39,16 @@ def decode_evt(evt):
     elif channel == 'ticker':
         pass
     elif channel == 'book':
-        pass
+        # book:SYMBOL[:PREC[:FREQ[:LEN]]]
+        defaults = [None, BOOK_PREC, BOOK_FREQ, BOOK_LEN]
+        params += defaults[len(params):]
+        kwargs['symbol'], kwargs['prec'], kwargs['freq'], kwargs['len'] = params[:4]
     elif channel == 'rawbook':
-        pass
+        # rawbook:SYMBOL[:LEN], raw books are precision R0 of the book channel
+        channel = 'book'
+        kwargs['symbol'] = params[0]
+        kwargs['prec'] = 'R0'
+        kwargs['len'] = params[1] if len(params) > 1 else BOOK_LEN
     elif channel == 'candles':
         symbol = params[0]
         period = params[1]
@@ -53,9 +71,10 @@ def encode_evt(msg: dict):
     elif name == 'ticker':
         pass
     elif name == 'book':
-        pass
-    elif name == 'rawbook':
-        pass
+        if msg['prec'] == 'R0':
+            evt = 'rawbook:{}:{}'.format(msg['symbol'], msg['len'])
+        else:
+            evt = 'book:{}:{}:{}:{}'.format(msg['symbol'], msg['prec'], msg['freq'], msg['len'])
     elif name == 'candles':
         _, symbol, period = msg['key'].split(':')
         evt = 'candles:{}:{}'.format(symbol, period)
@@ -63,10 +82,123 @@ def encode_evt(msg: dict):
     return cid, evt
 
 
+def canonical_evt(evt):
+    """Spell out the default parameters of a book event."""
+    channel, kwargs = decode_evt(evt)
+    if channel == 'book':
+        return encode_evt({'channel': channel, 'chanId': None, **kwargs})[1]
+    return evt
+
+
 def parse_raw_msg(msg):
     return json.loads(msg)
 
 
+def _js_number(x):
+    """Format a number as JavaScript's Number.toString() would."""
+    if x == int(x) and abs(x) < 1e21:
+        return str(int(x))
+
+    r = repr(float(x))
+    if 'e' not in r:
+        return r
+
+    # JavaScript only switches to exponents below 1e-6
+    if abs(x) >= 1e-6:
+        return format(Decimal(r), 'f')
+    mantissa, exp = r.split('e')
+    return '{}e{}'.format(mantissa, int(exp))
+
+
+class LocalBook:
+    """Order book of a Bitfinex book subscription kept from its updates.
+
+    Entries are kept in Bitfinex's own format, [PRICE, COUNT, AMOUNT] for
+    price aggregated books and [ORDER_ID, PRICE, AMOUNT] for raw books, with
+    positive amounts for bids and negative amounts for asks. Each side is a
+    dict of entries and a list of sort keys, best first, maintained with
+    bisection. Every update is a dict operation plus a binary search; the
+    list insertion itself shifts at most the book length, which Bitfinex
+    caps at a few hundred entries.
+
+    Args
+    ----
+    raw : bool
+        Whether the subscription is a raw book of individual orders
+
+    """
+
+    def __init__(self, raw=False):
+        self.raw = raw
+        self.clear()
+
+    def clear(self):
+        self._entries = ({}, {})
+        self._keys = ([], [])
+
+    def snapshot(self, entries):
+        """Replace the book with a snapshot of entries."""
+        self.clear()
+        for entry in entries:
+            self.update(entry)
+
+    def update(self, entry):
+        """Apply a single update entry."""
+        if self.raw:
+            ident, price, amount = entry
+            delete = price == 0
+        else:
+            price, count, amount = entry
+            ident = price
+            delete = count == 0
+
+        side = 0 if amount > 0 else 1
+        entries, keys = self._entries[side], self._keys[side]
+
+        old = entries.pop(ident, None)
+        if old is not None:
+            key = self._key(side, old)
+            del keys[bisect_left(keys, key)]
+
+        if not delete:
+            entries[ident] = list(entry)
+            insort(keys, self._key(side, entry))
+
+    def top(self, n=25):
+        """Return the best n bid and ask entries, best first."""
+        return tuple(
+            [entries[ident] for _, ident in keys[:n]]
+                for entries, keys in zip(self._entries, self._keys)
+        )
+
+    def checksum(self):
+        """Return the CRC32 checksum of the top 25 levels as Bitfinex computes it.
+
+        Bid and ask entries are interleaved as price and amount pairs, order
+        id and amount for raw books, joined by colons, and hashed to a signed
+        32 bit integer.
+        """
+        bids, asks = self.top(25)
+        values = []
+        for i in range(25):
+            for side in (bids, asks):
+                if i < len(side):
+                    values.append(side[i][0])
+                    values.append(side[i][2])
+
+        crc = zlib.crc32(':'.join(map(_js_number, values)).encode())
+        return crc - 2**32 if crc >= 2**31 else crc
+
+    def _key(self, side, entry):
+        if self.raw:
+            ident, price, _ = entry
+        else:
+            price, _, _ = entry
+            ident = price
+        # Best prices sort first, orders at a price in arrival order
+        return (-price if side == 0 else price, ident)
+
+
 class Code(Enum):
     ERR_UNK          = 10000
     ERR_GENERIC      = 10001
@@ -102,6 +234,9 @@ class BitfinexFeed:
         # { event: [cb0, cb1, ...], ... }
         self._callbacks = {}
 
+        # { event: LocalBook, ... }
+        self._books = {}
+
         # Incoming messages processing thread
         self._recv_thread = None
 
@@ -125,6 +260,9 @@ class BitfinexFeed:
         self.running = True
         self._recv_thread.start()
 
+        # Ask for checksums to verify local order books against
+        self._send({'event': 'conf', 'flags': FLAG_CHECKSUM})
+
     def close(self):
         """Disconnect from Bitfinex."""
         if self.connected:
@@ -136,6 +274,9 @@ class BitfinexFeed:
     def on(self, evt, callback):
         """Bind a callback to an event.
 
+        Callbacks of book and rawbook events are called with the LocalBook of
+        the subscription after every update, instead of the raw update.
+
         Args:
             evt: The event to listen for.
             callback: The callback function to be binded.
@@ -143,6 +284,8 @@ class BitfinexFeed:
         if not self.connected:
             raise ConnectionClosed()
 
+        evt = canonical_evt(evt)
+
         if evt not in self._callbacks:
             self._callbacks[evt] = []
             channel, kwargs = decode_evt(evt)
@@ -237,6 +380,12 @@ class BitfinexFeed:
             self._id_event[cid] = evt
             _log.info('Subscription success "{}":{}'.format(evt, cid))
 
+        elif bfx_event == 'unsubscribed':
+            self._id_event.pop(msg['chanId'], None)
+
+        elif bfx_event == 'conf':
+            _log.info('Configuration {}: {}'.format(msg.get('flags'), msg.get('status')))
+
         elif bfx_event == 'pong':
             pass
 
@@ -249,6 +398,47 @@ class BitfinexFeed:
             _log.info('Heartbeat {}'.format(msg[0]))
             return
         cid = msg.pop(0)
-        evt = self._id_event[cid]
+        evt = self._id_event.get(cid)
+        if evt is None:
+            # Left over from a channel being resubscribed
+            return
+
+        if evt.startswith(('book:', 'rawbook:')):
+            self._handleBook(cid, evt, msg)
+            return
+
         for cb in self._callbacks[evt]:
             cb(*msg)
+
+    def _handleBook(self, cid, evt, msg):
+        if msg[0] == 'cs':
+            book = self._books.get(evt)
+            if book is not None and book.checksum() != msg[1]:
+                _log.warning('Checksum mismatch on "{}", resubscribing'.format(evt))
+                self._resubscribe(cid, evt)
+            return
+
+        book = self._books.get(evt)
+        if book is None:
+            book = self._books[evt] = LocalBook(raw=evt.startswith('rawbook:'))
+
+        # Snapshots of empty books are empty lists
+        data = msg[0]
+        if not data or isinstance(data[0], list):
+            book.snapshot(data)
+        else:
+            book.update(data)
+
+        for cb in self._callbacks[evt]:
+            cb(book)
+
+    def _resubscribe(self, cid, evt):
+        """Drop a channel and its local state and subscribe to it again."""
+        self._id_event.pop(cid, None)
+        self._books.pop(evt, None)
+        self._send({'event': 'unsubscribe', 'chanId': cid})
+
+        channel, kwargs = decode_evt(evt)
+        msg = {'event': 'subscribe', 'channel': channel}
+        msg.update(kwargs)
+        self._send(msg)
@@ -1,4 +1,5 @@
 import time
+import zlib
 import logging
 
 import pytest
@@ -43,3 +44,94 @@ def test_bifinex_on_trade():
     feed.on('trades:tBTCUSD', print)
     time.sleep(5)
     feed.close()
+
+
+def test_bitfinex_decode_book():
+    assert bfx.decode_evt('book:tBTCUSD:P1:F1:100') == ('book', {
+        'symbol': 'tBTCUSD', 'prec': 'P1', 'freq': 'F1', 'len': '100'
+    })
+    assert bfx.decode_evt('rawbook:tBTCUSD') == ('book', {
+        'symbol': 'tBTCUSD', 'prec': 'R0', 'len': '25'
+    })
+    assert bfx.canonical_evt('book:tBTCUSD') == 'book:tBTCUSD:P0:F0:25'
+
+
+def test_bitfinex_encode_book():
+    msg = {'channel': 'book', 'chanId': 2, 'symbol': 'tBTCUSD', 'prec': 'P0', 'freq': 'F0',
+           'len': '25', 'pair': 'BTCUSD'}
+    assert bfx.encode_evt(msg) == (2, 'book:tBTCUSD:P0:F0:25')
+
+    msg = {'channel': 'book', 'chanId': 3, 'symbol': 'tBTCUSD', 'prec': 'R0', 'len': '100'}
+    assert bfx.encode_evt(msg) == (3, 'rawbook:tBTCUSD:100')
+
+
+def test_bitfinex_local_book():
+    book = bfx.LocalBook()
+    book.snapshot([[100, 1, 2.0], [99, 2, 1.5], [101, 1, -1.0], [103, 3, -4.0]])
+    book.update([102, 1, -0.5])
+    book.update([99, 0, 1])
+
+    bids, asks = book.top(2)
+    assert bids == [[100, 1, 2.0]]
+    assert asks == [[101, 1, -1.0], [102, 1, -0.5]]
+
+    # Levels are interleaved as bid, ask pairs formatted as in JavaScript
+    expected = zlib.crc32(b'100:2:101:-1:102:-0.5:103:-4')
+    assert book.checksum() == expected - 2**32 * (expected >= 2**31)
+
+
+def test_bitfinex_local_rawbook():
+    book = bfx.LocalBook(raw=True)
+    book.snapshot([[1, 100, 2.0], [2, 100, 1.0], [3, 101, -1.0]])
+    book.update([1, 0, 1])
+    book.update([3, 100.5, -1.0])
+
+    bids, asks = book.top()
+    assert bids == [[2, 100, 1.0]]
+    assert asks == [[3, 100.5, -1.0]]
+
+
+def test_js_number():
+    assert [bfx._js_number(x) for x in (6400.0, -0.5, 0.00001, 1e-7, 12345678901)] == \
+        ['6400', '-0.5', '0.00001', '1e-7', '12345678901']
+
+
+def test_bitfinex_book_resubscribe():
+    feed = bfx.BitfinexFeed()
+    sent = []
+    feed._send = sent.append
+
+    evt = 'book:tBTCUSD:P0:F0:25'
+    books = []
+    feed._id_event[7] = evt
+    feed._callbacks[evt] = [books.append]
+
+    feed._handleUpdate([7, [[100, 1, 2.0], [101, 1, -1.0]]])
+    feed._handleUpdate([7, [100, 1, 3.0]])
+    assert books[-1].top(1)[0] == [[100, 1, 3.0]]
+
+    feed._handleUpdate([7, 'cs', books[-1].checksum()])
+    assert sent == []
+
+    feed._handleUpdate([7, 'cs', 0])
+    assert sent[0] == {'event': 'unsubscribe', 'chanId': 7}
+    assert sent[1] == {'event': 'subscribe', 'channel': 'book', 'symbol': 'tBTCUSD',
+                       'prec': 'P0', 'freq': 'F0', 'len': '25'}
+
+    # Updates left over from the old channel are ignored
+    feed._handleUpdate([7, [100, 1, 5.0]])
+    assert len(books) == 2
+
+
+def test_bitfinex_empty_book_snapshot():
+    feed = bfx.BitfinexFeed()
+    evt  = 'book:tBTCUSD:P0:F0:25'
+    books = []
+    feed._id_event[7] = evt
+    feed._callbacks[evt] = [books.append]
+
+    feed._handleUpdate([7, []])
+    assert books[-1].top() == ([], [])
+
+    feed._handleUpdate([7, [100, 1, 2.0]])
+    assert books[-1].top()[0] == [[100, 1, 2.0]]
@@ -1,4 +1,4 @@
-from threading import Thread, Timer
+from threading import Thread, Event
 from collections import defaultdict
 import websocket
 import logging
@@ -27,7 +27,6 @@ class Connection(Thread):
         self.default_reconnect_interval = reconnect_interval
         self.reconnect_interval = reconnect_interval
 
-        self.pong_timer = None
         self.pong_received = False
         self.pong_timeout = 30
 
@@ -52,10 +51,17 @@ class Connection(Thread):
         # received in exact 5 minute intervals.
 
         self.connection_timeout = 305
-        self.connection_timer = None
-
         self.ping_interval = 120
-        self.ping_timer = None
+
+        # A single watchdog thread enforces the ping interval, pong timeout and
+        # connection timeout. The receive path only records a monotonic
+        # timestamp, so no threads are created or cancelled per message.
+        self.watchdog = None
+        self.watchdog_interval = 1
+        self._watchdog_stop = Event()
+        self._watching = False
+        self._last_seen = time.monotonic()
+        self._ping_sent_at = None
 
         Thread.__init__(self, **thread_kwargs)
         self.daemon = daemon
@@ -73,6 +79,7 @@ class Connection(Thread):
     def disconnect(self, timeout=None):
         self.needs_reconnect = False
         self.disconnect_called = True
+        self._stop_watchdog()
         if self.socket:
             self.socket.close()
         self.join(timeout)
@@ -89,6 +96,7 @@ class Connection(Thread):
             self.socket.close()
 
     def run(self):
+        self._start_watchdog()
         self._connect()
 
     def _connect(self):
@@ -120,8 +128,9 @@ class Connection(Thread):
         # Send a ping right away to inform that the connection is alive. If you
         # don't do this, it takes the ping interval to subcribe to channel and
         # events
+        self._last_seen = time.monotonic()
+        self._watching = True
         self.send_ping()
-        self._start_timers()
 
     def _on_error(self, ws, error):
         logger.error("Connection: Error - %s" % error)
@@ -129,10 +138,10 @@ class Connection(Thread):
         self.needs_reconnect = True
 
     def _on_message(self, ws, message):
-        logger.debug("Connection: Message - %s" % message)
+        # Any data counts as a sign of life for the watchdog
+        self._last_seen = time.monotonic()
 
-        # Stop our timeout timer, since we got some data
-        self._stop_timers()
+        logger.debug("Connection: Message - %s" % message)
 
         params = self._parse(message)
 
@@ -156,36 +165,55 @@ class Connection(Thread):
                     params['channel']
                 )
 
-        # We've handled our data, so restart our connection timeout handler
-        self._start_timers()
-
     def _on_close(self, ws, *args):
         logger.info("Connection: Connection closed")
         self.state = "disconnected"
-        self._stop_timers()
+        self._watching = False
+        self._ping_sent_at = None
 
     @staticmethod
     def _parse(message):
         return json.loads(message)
 
-    def _stop_timers(self):
-        if self.ping_timer:
-            self.ping_timer.cancel()
-
-        if self.connection_timer:
-            self.connection_timer.cancel()
+    def _start_watchdog(self):
+        if self.watchdog and self.watchdog.is_alive():
+            return
 
-        if self.pong_timer:
-            self.pong_timer.cancel()
+        self._watchdog_stop.clear()
+        self.watchdog = Thread(target=self._watch, name='pysher-watchdog')
+        self.watchdog.daemon = True
+        self.watchdog.start()
 
-    def _start_timers(self):
-        self._stop_timers()
+    def _stop_watchdog(self):
+        self._watchdog_stop.set()
 
-        self.ping_timer = Timer(self.ping_interval, self.send_ping)
-        self.ping_timer.start()
+    def _watch(self):
+        """Watchdog loop checking connection liveness once per interval."""
+        while not self._watchdog_stop.wait(self.watchdog_interval):
+            if not self._watching:
+                continue
 
-        self.connection_timer = Timer(self.connection_timeout, self._connection_timed_out)
-        self.connection_timer.start()
+            try:
+                self._check_liveness(time.monotonic())
+            except Exception:
+                logger.exception("Watchdog raised unhandled")
+
+    def _check_liveness(self, now):
+        last_seen = self._last_seen
+        ping_sent_at = self._ping_sent_at
+
+        if ping_sent_at is not None:
+            if last_seen > ping_sent_at:
+                # Something arrived after our ping, the connection is alive
+                self._ping_sent_at = None
+            elif now - ping_sent_at >= self.pong_timeout:
+                self._check_pong()
+                return
+
+        if now - last_seen >= self.connection_timeout:
+            self._connection_timed_out()
+        elif now - last_seen >= self.ping_interval and self._ping_sent_at is None:
+            self.send_ping(now)
 
     def send_event(self, event_name, data, channel_name=None):
         event = {'event': event_name, 'data': data}
@@ -198,14 +226,15 @@ class Connection(Thread):
         except Exception as e:
             logger.error("Failed send event: %s" % e)
 
-    def send_ping(self):
+    def send_ping(self, now=None):
         logger.debug("Connection: ping to pusher")
+        # Reset before sending, a pong may be handled before send() returns
+        self.pong_received = False
+        self._ping_sent_at = time.monotonic() if now is None else now
         try:
             self.socket.send(json.dumps({'event': 'pusher:ping', 'data': ''}))
         except Exception as e:
             logger.error("Failed send ping: %s" % e)
-        self.pong_timer = Timer(self.pong_timeout, self._check_pong)
-        self.pong_timer.start()
 
     def send_pong(self):
         logger.debug("Connection: pong to pusher")
@@ -215,12 +244,13 @@ class Connection(Thread):
             logger.error("Failed send pong: %s" % e)
 
     def _check_pong(self):
-        self.pong_timer.cancel()
+        self._ping_sent_at = None
 
         if self.pong_received:
             self.pong_received = False
         else:
             logger.warning("Did not receive pong in time.  Will attempt to reconnect.")
+            self._watching = False
             self.state = "failed"
             self.reconnect()
 
@@ -239,12 +269,11 @@ class Connection(Thread):
 
     def _ping_handler(self, data):
         self.send_pong()
-        # Restart our timers since we received something on the connection
-        self._start_timers()
 
     def _pong_handler(self, data):
         logger.debug("Connection: pong from pusher")
         self.pong_received = True
+        self._ping_sent_at = None
 
     def _pusher_error_handler(self, data):
         if 'code' in data:
@@ -277,5 +306,6 @@ class Connection(Thread):
 
     def _connection_timed_out(self):
         logger.warning("Did not receive any data in time. Reconnecting.")
+        self._watching = False
         self.state = "failed"
         self.reconnect()
@@ -0,0 +1,98 @@
+import json
+
+from pysher.connection import Connection
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, msg):
+        self.sent.append(json.loads(msg)['event'])
+
+
+def make_connection():
+    conn = Connection(lambda *args: None, 'ws://localhost')
+    conn.socket = FakeSocket()
+    conn.reconnects = 0
+
+    def reconnect(interval=None):
+        conn.reconnects += 1
+    conn.reconnect = reconnect
+    return conn
+
+
+def test_ping_after_interval():
+    conn = make_connection()
+    start = conn._last_seen
+
+    conn._check_liveness(start + conn.ping_interval - 1)
+    assert conn.socket.sent == []
+
+    conn._check_liveness(start + conn.ping_interval)
+    assert conn.socket.sent == ['pusher:ping']
+    assert conn._ping_sent_at is not None
+
+    # No second ping while one is outstanding
+    conn._check_liveness(start + conn.ping_interval + 1)
+    assert conn.socket.sent == ['pusher:ping']
+    assert conn._ping_sent_at == start + conn.ping_interval
+    assert conn.reconnects == 0
+
+
+def test_pong_received():
+    conn = make_connection()
+    conn.send_ping()
+    conn._pong_handler('')
+
+    assert conn.pong_received and conn._ping_sent_at is None
+    conn._check_liveness(conn._last_seen + 1)
+    assert conn.reconnects == 0
+
+
+def test_pong_before_send_returns():
+    conn = make_connection()
+
+    # The receive thread handles the pong while send() is still running
+    send = conn.socket.send
+    def send_and_pong(msg):
+        send(msg)
+        conn._pong_handler('')
+    conn.socket.send = send_and_pong
+
+    conn.send_ping()
+    assert conn.pong_received and conn._ping_sent_at is None
+
+
+def test_pong_timeout():
+    conn = make_connection()
+    conn.send_ping()
+    sent_at = conn._ping_sent_at
+
+    conn._check_liveness(sent_at + conn.pong_timeout - 1)
+    assert conn.reconnects == 0
+
+    conn._check_liveness(sent_at + conn.pong_timeout)
+    assert conn.reconnects == 1
+    assert conn.state == 'failed'
+
+
+def test_message_after_ping_counts_as_pong():
+    conn = make_connection()
+    conn.send_ping()
+    conn._last_seen = conn._ping_sent_at + 1
+
+    conn._check_liveness(conn._last_seen + 1)
+    assert conn._ping_sent_at is None and conn.reconnects == 0
+
+
+def test_connection_timeout():
+    conn = make_connection()
+    conn.ping_interval = conn.connection_timeout + 1
+
+    conn._check_liveness(conn._last_seen + conn.connection_timeout - 1)
+    assert conn.reconnects == 0
+
+    conn._check_liveness(conn._last_seen + conn.connection_timeout)
+    assert conn.reconnects == 1
+    assert conn.state == 'failed'
@@ -6,11 +6,21 @@ import logging
 from functools import partial
 
 from feed import bitstamp
-from datasink import Datasink, stdout_logger
+from datasink import Datasink, RecordSink, stdout_logger
 
 
 CONFIG_FILE = 'diff.conf'
 
+# Typed fields for columnar output
+SCHEMA = [
+    ('id', 'int64'),
+    ('price', 'float64'),
+    ('amount', 'float64'),
+    ('order_type', 'int8'),
+    ('diff_type', 'string'),
+    ('microtimestamp', 'int64'),
+]
+
 
 def record_diff(record, diff_type, sink):
     rec = json.loads(record)
@@ -23,52 +33,82 @@ def record_diff(record, diff_type, sink):
     return
 
 
+def record_diff_record(record, diff_type, sink):
+    rec = json.loads(record)
+    sink.write((
+        int(rec['id']),
+        float(rec['price']),
+        float(rec['amount']),
+        int(rec['order_type']),
+        diff_type,
+        int(rec['microtimestamp']),
+    ))
+
+
 def main(
         *,
         root='cryptle-exchange/bitstamp-diff',
         pairs=('btcusd', 'bchusd', 'ethusd', 'xrpusd'),
         resolution=Datasink.MINUTE,
-        backend='os'
+        backend='os',
+        fmt='csv'
     ):
     # Use csv header
-    header = ['time', 'id', 'price', 'volume', 'order_type', 'diff_type', 'src_time']
+    header = ['id', 'price', 'amount', 'order_type', 'diff_type', 'microtimestamp']
     header = ','.join(header)
     ext    = 'csv'
 
     # Prepare sinks
     sinks = {}
     for pair in pairs:
-        sinks[pair] = Datasink(
-            root='-'.join([root, pair]),
-            ext=ext,
-            header=header,
-            namemode=2,
-            resolution=resolution,
-            backend=backend,
-        )
-
-    conn = bitstamp.BitstampFeed()
-    conn.connect()
+        if fmt == 'csv':
+            sinks[pair] = Datasink(
+                root='-'.join([root, pair]),
+                ext=ext,
+                header=header,
+                namemode=2,
+                resolution=resolution,
+                backend=backend,
+            )
+        else:
+            sinks[pair] = RecordSink(
+                root='-'.join([root, pair]),
+                schema=SCHEMA,
+                ext=fmt,
+                namemode=2,
+                resolution=resolution,
+                backend=backend,
+            )
 
-    for pair in pairs:
-        conn.onCreate(pair, partial(record_diff, diff_type='create', sink=sinks[pair]))
-        conn.onDelete(pair, partial(record_diff, diff_type='delete', sink=sinks[pair]))
-        conn.onChange(pair, partial(record_diff, diff_type='take', sink=sinks[pair]))
-
-    while True:
-        try:
-            while conn.is_connected():
-                time.sleep(0.2)
-        except ConnectionError:
-            # reconnect
-            conn.connect()
-        except KeyboardInterrupt:
-            print('\rTerminating...')
-            conn.close()
-            return 0
-        except Exception:
-            logging.error('Uncaught exception %s', e)
-            return 1
+    record = record_diff if fmt == 'csv' else record_diff_record
+
+    # Columnar files are only readable once their footer is written on close
+    try:
+        conn = bitstamp.BitstampFeed()
+        conn.connect()
+
+        for pair in pairs:
+            conn.onCreate(pair, partial(record, diff_type='create', sink=sinks[pair]))
+            conn.onDelete(pair, partial(record, diff_type='delete', sink=sinks[pair]))
+            conn.onChange(pair, partial(record, diff_type='take', sink=sinks[pair]))
+
+        while True:
+            try:
+                while conn.is_connected():
+                    time.sleep(0.2)
+            except ConnectionError:
+                # reconnect
+                conn.connect()
+            except KeyboardInterrupt:
+                print('\rTerminating...')
+                conn.close()
+                return 0
+            except Exception as e:
+                logging.error('Uncaught exception %s', e)
+                return 1
+    finally:
+        for sink in sinks.values():
+            sink.close()
 
 
 if __name__ == '__main__':
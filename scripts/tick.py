@@ -6,11 +6,19 @@ import logging
 from functools import partial
 
 from feed import bitstamp
-from datasink import Datasink, stdout_logger
+from datasink import Datasink, RecordSink, stdout_logger
 
 
 CONFIG_FILE = 'tick.conf'
 
+# Typed fields for columnar output
+SCHEMA = [
+    ('id', 'int64'),
+    ('price', 'float64'),
+    ('amount', 'float64'),
+    ('timestamp', 'int64'),
+]
+
 
 def write_tick_to_sink(record, sink):
     rec = json.loads(record)
@@ -19,12 +27,23 @@ def write_tick_to_sink(record, sink):
     sink.write(msg)
 
 
+def write_tick_record_to_sink(record, sink):
+    rec = json.loads(record)
+    sink.write((
+        int(rec['id']),
+        float(rec['price']),
+        float(rec['amount']),
+        int(rec['timestamp']),
+    ))
+
+
 def main(
         *,
         root='cryptle-exchange/bitstamp-tick',
         pairs=('btcusd', 'bchusd', 'ethusd', 'xrpusd'),
         resolution=Datasink.MINUTE,
-        backend='os'
+        backend='os',
+        fmt='csv'
     ):
     header = ['id', 'price', 'amount', 'time']
     header = ','.join(header)
@@ -33,35 +52,52 @@ def main(
     # Prepare sinks
     sinks = {}
     for pair in pairs:
-        sinks[pair] = Datasink(
-            root='-'.join([root, pair]),
-            ext=ext,
-            header=header,
-            namemode=2,
-            resolution=resolution,
-            backend=backend,
-        )
-
-    conn = bitstamp.BitstampFeed()
-    conn.connect()
+        if fmt == 'csv':
+            sinks[pair] = Datasink(
+                root='-'.join([root, pair]),
+                ext=ext,
+                header=header,
+                namemode=2,
+                resolution=resolution,
+                backend=backend,
+            )
+        else:
+            sinks[pair] = RecordSink(
+                root='-'.join([root, pair]),
+                schema=SCHEMA,
+                ext=fmt,
+                namemode=2,
+                resolution=resolution,
+                backend=backend,
+            )
 
-    for pair in pairs:
-        conn.onTrade(pair, partial(write_tick_to_sink, sink=sinks[pair]))
-
-    while True:
-        try:
-            while conn.is_connected():
-                time.sleep(0.2)
-        except ConnectionError:
-            # reconnect
-            conn.connect()
-        except KeyboardInterrupt:
-            print('\rTerminating...')
-            conn.close()
-            return 0
-        except Exception:
-            logging.error('Uncaught exception %s', e)
-            return 1
+    write = write_tick_to_sink if fmt == 'csv' else write_tick_record_to_sink
+
+    # Columnar files are only readable once their footer is written on close
+    try:
+        conn = bitstamp.BitstampFeed()
+        conn.connect()
+
+        for pair in pairs:
+            conn.onTrade(pair, partial(write, sink=sinks[pair]))
+
+        while True:
+            try:
+                while conn.is_connected():
+                    time.sleep(0.2)
+            except ConnectionError:
+                # reconnect
+                conn.connect()
+            except KeyboardInterrupt:
+                print('\rTerminating...')
+                conn.close()
+                return 0
+            except Exception as e:
+                logging.error('Uncaught exception %s', e)
+                return 1
+    finally:
+        for sink in sinks.values():
+            sink.close()
 
 
 if __name__ == '__main__':
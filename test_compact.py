@@ -0,0 +1,54 @@
+import os
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+import compact
+from datasink import Datasink
+
+
+def make_day(root, day):
+    """Write a day of unsorted ticks with a duplicate into two hour files."""
+    for hour, rows in ((3, ['2,10.0,1.0,300', '1,9.0,1.0,100']),
+                       (5, ['1,9.0,1.0,100', '3,11.0,2.0,200'])):
+        path = os.path.join(root, day.strftime('%Y/%m/%d'), '{:02d}.csv'.format(hour))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write('id,price,amount,timestamp\n' + '\n'.join(rows) + '\n')
+
+
+def test_compact_day(tmp_path):
+    root, dest = str(tmp_path / 'tick'), str(tmp_path / 'daily')
+    day = datetime(2018, 11, 30)
+    make_day(root, day)
+
+    options = dict(resolution=Datasink.HOUR, namemode=0, header=True)
+    assert compact.compact_day(root, dest, day, **options) == 3
+
+    out  = compact._daypath(dest, day)
+    data = pd.read_parquet(out)
+    assert list(data.timestamp) == [100, 200, 300]
+    assert list(data.id) == [1, 3, 2]
+
+    # Only the renamed output is left behind
+    assert os.listdir(os.path.dirname(out)) == ['30.parquet']
+
+    # Reruns skip days whose output is newer than their inputs
+    assert compact.compact_day(root, dest, day, **options) is None
+    assert compact.compact_day(root, dest, day, force=True, **options) == 3
+
+    # Days without files are skipped
+    assert compact.compact_day(root, dest, day + timedelta(days=1), **options) is None
+
+
+def test_closed_days():
+    now   = datetime.now()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    start = today - timedelta(days=2)
+
+    assert list(compact.closed_days(start, now + timedelta(days=1))) == \
+        [today - timedelta(days=2), today - timedelta(days=1)]
+
+    # A day that just finished is held back until the grace period passes
+    grace = now - today + timedelta(minutes=1)
+    assert list(compact.closed_days(start, now, grace=grace)) == [today - timedelta(days=2)]
@@ -0,0 +1,374 @@
+import io
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import convert
+
+
+def make_ticks():
+    return pd.DataFrame({
+        'price':     [10.0, 12.0, 9.0, 11.0, 20.0],
+        'amount':    [1.0, 2.0, 1.0, 1.0, 5.0],
+        'timestamp': [61, 60, 65, 119, 245],
+        'type':      [0, 1, 0, 1, 0],
+    })
+
+
+def test_tick_to_candle():
+    candle = convert.tick_to_candle(make_ticks(), period='60')
+
+    assert list(candle.columns) == convert.CANDLE_COLUMNS
+    assert list(candle.timestamp) == [60, 120, 180, 240]
+
+    first = candle.iloc[0]
+    assert (first.open, first.close, first.high, first.low) == (12.0, 11.0, 12.0, 9.0)
+    assert first.volume == 5.0
+
+
+def test_tick_to_candle_fills_empty_bars():
+    candle = convert.tick_to_candle(make_ticks(), period='60')
+
+    for _, bar in candle.iloc[1:3].iterrows():
+        assert bar.open == bar.close == bar.high == bar.low == 11.0
+        assert bar.volume == 0
+
+    assert candle.iloc[3].open == 20.0
+
+
+def test_candle_stream_matches_batch():
+    tick   = make_ticks()
+    stream = convert.CandleStream(period='60')
+    parts  = [stream.push(tick.iloc[i:i + 2]) for i in range(0, len(tick), 2)]
+    parts.append(stream.flush())
+
+    streamed = pd.concat([p for p in parts if not p.empty], ignore_index=True)
+    batch    = convert.tick_to_candle(tick, period='60')
+
+    assert np.allclose(streamed[convert.CANDLE_COLUMNS].values.astype(float),
+                       batch[convert.CANDLE_COLUMNS].values.astype(float))
+
+
+def test_candle_pyramid():
+    tick    = make_ticks()
+    candles = convert.tick_to_candle(tick, period='60,120,240')
+
+    assert sorted(candles) == [60, 120, 240]
+    for period, candle in candles.items():
+        expected = convert.tick_to_candle(tick, period=str(period))
+        assert np.allclose(candle.values.astype(float), expected.values.astype(float))
+
+
+def test_candle_pyramid_stream():
+    tick   = make_ticks()
+    stream = convert.CandleStream(period='60,120')
+    parts  = [stream.push(tick.iloc[i:i + 2]) for i in range(0, len(tick), 2)]
+    parts.append(stream.flush())
+
+    for period in (60, 120):
+        streamed = pd.concat([p[period] for p in parts if not p[period].empty],
+                             ignore_index=True)
+        expected = convert.tick_to_candle(tick, period=str(period))
+        assert np.allclose(streamed.values.astype(float), expected.values.astype(float))
+
+
+def test_candle_pyramid_stream_not_nested():
+    rng  = np.random.default_rng(0)
+    tick = pd.DataFrame({
+        'price': rng.random(5000) + 100,
+        'amount': rng.random(5000),
+        'timestamp': np.sort(rng.integers(0, 5000, 5000)),
+    })
+    for period in ('60,300,420', '60,120,180'):
+        stream = convert.CandleStream(period=period)
+        parts  = [stream.push(tick.iloc[i:i + 333]) for i in range(0, len(tick), 333)]
+        parts.append(stream.flush())
+
+        expected = convert.tick_to_candle(tick, period=period)
+        for p, candles in expected.items():
+            streamed = pd.concat([part[p] for part in parts if not part[p].empty],
+                                 ignore_index=True)
+            assert np.allclose(streamed.values.astype(float), candles.values.astype(float))
+
+
+def test_partition_stitching():
+    tick  = make_ticks().sort_values('timestamp')
+    parts = [convert.tick_to_sparse_candle(tick.iloc[:2], period='120'),
+             convert.tick_to_sparse_candle(tick.iloc[2:], period='120')]
+
+    # The first bar straddles both partitions
+    stitched = convert.sparse_candle_to_candle(pd.concat(parts), period='120')
+    expected = convert.tick_to_candle(tick, period='120')
+    assert np.allclose(stitched.values.astype(float), expected.values.astype(float))
+
+
+def test_candle_to_tuple():
+    buf = io.StringIO()
+    convert.candle_to_tuple(convert.tick_to_candle(make_ticks(), period='60'), buf)
+
+    lines = buf.getvalue().splitlines()
+    assert len(lines) == 4
+    assert lines[0] == '(12.0,12.0,9.0,11.0,5.0,60)'
+
+
+def test_tick_to_tuple():
+    buf = io.StringIO()
+    convert.tick_to_tuple(make_ticks().assign(type=['buy'] * 5), buf)
+    assert buf.getvalue().splitlines()[0] == '(10.0,61,1.0,buy)'
+
+
+def make_diffs():
+    return pd.DataFrame({
+        'id':             [1, 2, 3, 1, 2, 4],
+        'price':          [100.0, 101.0, 99.0, 100.0, 101.0, 102.0],
+        'amount':         [1.0, 2.0, 3.0, 0.4, 2.0, 1.0],
+        'order_type':     [0, 1, 0, 0, 1, 1],
+        'diff_type':      ['create', 'create', 'create', 'take', 'delete', 'create'],
+        'microtimestamp': [100, 200, 300, 1500000, 1600000, 2500000],
+    })
+
+
+def test_diff_to_book():
+    book = convert.diff_to_book(make_diffs(), interval=1, depth=2)
+
+    assert list(book.microtimestamp) == [1000000, 2000000]
+    first, second = book.iloc[0], book.iloc[1]
+    assert (first.bid_price_0, first.bid_amount_0) == (100.0, 1.0)
+    assert (first.bid_price_1, first.bid_amount_1) == (99.0, 3.0)
+    assert (first.ask_price_0, first.ask_amount_0) == (101.0, 2.0)
+    assert np.isnan(first.ask_price_1)
+
+    # Takes leave the remaining amount, deletes empty the level
+    assert second.bid_amount_0 == 0.4
+    assert np.isnan(second.ask_price_0)
+
+
+def test_book_stream():
+    diff   = make_diffs()
+    stream = convert.BookStream(interval=1, depth=2)
+    parts  = [stream.push(diff.iloc[:4]), stream.push(diff.iloc[4:])]
+
+    streamed = pd.concat(parts, ignore_index=True)
+    expected = convert.diff_to_book(diff, interval=1, depth=2)
+    assert streamed.equals(expected)
+
+
+def test_orderbook_to_features():
+    import json
+
+    snapshots = [
+        {'microtimestamp': '1000000', 'bids': [['99.99', '1.0'], ['99.9', '2.0'], ['99.0', '5.0']],
+         'asks': [['100.01', '3.0'], ['100.5', '4.0']]},
+        {'microtimestamp': '2000000', 'bids': [['99.99', '1.0']], 'asks': [['100.01', '1.0']]},
+    ]
+    src  = io.StringIO(''.join(json.dumps(s) + '\n' for s in snapshots))
+    book = convert.read_data(src, 'orderbook', 'json', depth=3)
+    assert book.shape == (2, 13)
+    assert np.isnan(book.ask_price_2[0])
+
+    features = convert.convert(book, 'orderbook', 'features', bps='1,20,100')
+    assert np.allclose(features.spread, 0.02)
+    assert list(features.imbalance) == [-0.5, 0.0]
+    assert list(features.bid_depth_20) == [3.0, 1.0]
+    assert list(features.ask_depth_100) == [7.0, 1.0]
+    assert features.imbalance_100[0] == (8 - 7) / 15
+
+
+def test_event_bars():
+    tick = make_ticks()
+
+    # Cumulative amount in time order is 2, 3, 4, 5, 10, the last tick
+    # overshoots the second bar
+    bars = convert.convert(tick, 'tick', 'volumebar', threshold='3')
+    assert list(bars.volume) == [3.0, 7.0]
+    assert list(bars.timestamp) == [60, 65]
+    assert list(bars.close) == [10.0, 20.0]
+
+    bars = convert.convert(tick, 'tick', 'tickbar', threshold='2')
+    assert list(bars.timestamp) == [60, 65, 245]
+
+    bars = convert.convert(tick, 'tick', 'dollarbar', threshold='50')
+    assert bars.volume.sum() == tick.amount.sum()
+
+
+def test_event_bar_stream():
+    rng  = np.random.default_rng(0)
+    tick = pd.DataFrame({
+        'price': rng.integers(90, 110, 1000).astype(float),
+        'amount': rng.integers(0, 4, 1000).astype(float),
+        'timestamp': np.arange(1000),
+    })
+    for output in ('volumebar', 'dollarbar', 'tickbar'):
+        stream = convert._stream_table[('tick', output)](threshold='100')
+        parts  = [stream.push(tick.iloc[i:i + 77]) for i in range(0, 1000, 77)]
+        parts.append(stream.flush())
+
+        streamed = pd.concat(parts, ignore_index=True)
+        expected = convert.convert(tick, 'tick', output, threshold='100')
+        assert np.array_equal(streamed.values.astype(float), expected.values.astype(float))
+
+
+def test_typed_loaders():
+    src  = io.StringIO('id,price,amount,time\n1,10.5,0.1,60\n2,11.0,0.2,61\n')
+    tick = convert.read_data(src, 'tick', 'csv', usecols='price,timestamp')
+    assert list(tick.columns) == ['price', 'timestamp']
+    assert tick.timestamp.dtype == np.int64
+
+    src  = io.StringIO(
+        'id,price,amount,order_type,diff_type,microtimestamp\n'
+        '1,10.5,0.1,0,create,1000\n1,10.5,0.1,0,delete,2000\n'
+    )
+    chunks = list(convert.read_data(src, 'diff', 'csv', chunksize=1))
+    diff   = pd.concat(chunks, ignore_index=True)
+    assert diff.diff_type.dtype == 'category'
+    assert diff.order_type.dtype == np.int8
+    assert diff.microtimestamp.dtype == np.int64
+
+
+def test_result_cache(tmp_path):
+    src = tmp_path / 'tick.csv'
+    make_ticks().to_csv(src, index=False)
+    cache = convert.ResultCache(str(tmp_path / 'cache'), min_age=0)
+
+    first = convert.convert_file(str(src), 'tick', 'candle', 'csv', cache=cache, period='60')
+    assert len(list((tmp_path / 'cache').iterdir())) == 1
+
+    # Hits are served without reading the source
+    key = cache.key(str(src), 'convert', 'tick', 'candle', 'csv', {'period': '60'})
+    cache.put(key, first.iloc[:0])
+    hit = convert.convert_file(str(src), 'tick', 'candle', 'csv', cache=cache, period='60')
+    assert hit.empty
+
+    # Rewriting the source invalidates its entries
+    make_ticks().iloc[:2].to_csv(src, index=False)
+    os.utime(src, ns=(0, 10**9))
+    assert len(convert.convert_file(str(src), 'tick', 'candle', 'csv', cache=cache, period='60')) == 1
+
+    # Least recently used entries are evicted past the size bound
+    cache.max_bytes = 0
+    cache.evict()
+    assert list((tmp_path / 'cache').iterdir()) == []
+
+
+def test_live_candle():
+    tick   = make_ticks().sort_values('timestamp', kind='mergesort')
+    candle = convert.LiveCandle(60)
+
+    rows = []
+    for price, amount, timestamp in zip(tick.price, tick.amount, tick.timestamp):
+        rows += candle.update(price, amount, timestamp)
+    assert candle.expire(299) == []
+    rows += candle.expire(300)
+
+    expected = convert.tick_to_candle(tick, period='60')
+    live = pd.DataFrame(rows, columns=convert.CANDLE_COLUMNS)
+    assert np.allclose(live.values.astype(float), expected.values.astype(float))
+
+
+def test_parallel_json(tmp_path, monkeypatch):
+    import json
+
+    src = tmp_path / 'tick.json'
+    with open(src, 'w') as f:
+        for i in range(1000):
+            f.write(json.dumps({'id': i, 'price': str(100 + i % 7), 'amount': '0.5',
+                                'timestamp': str(60 + i), 'type': i % 2}) + '\n')
+
+    monkeypatch.setattr(convert, '_PARALLEL_JSON_BYTES', 0)
+    tick = convert.read_data(str(src), 'tick', 'json', jobs=3)
+    assert list(tick.id) == list(range(1000))
+    assert tick.price.dtype == np.float64 and tick.type.dtype == np.int8
+
+    # Ranges start on line boundaries and cover the whole file
+    ranges = convert._line_ranges(str(src), 7)
+    assert ranges[0][0] == 0 and ranges[-1][1] == os.path.getsize(src)
+    assert all(hi == lo for (_, hi), (lo, _) in zip(ranges, ranges[1:]))
+
+
+def test_live_candle_expire_between_ticks():
+    tick   = pd.DataFrame({'price': [1.0, 2.0, 3.0], 'amount': [1.0, 1.0, 1.0],
+                           'timestamp': [5, 200, 205]})
+    candle = convert.LiveCandle(60)
+
+    rows  = candle.update(1.0, 1.0, 5)
+    rows += candle.expire(65)
+    rows += candle.expire(130)
+    rows += candle.update(2.0, 1.0, 200)
+    rows += candle.expire(190)
+    rows += candle.update(3.0, 1.0, 205)
+    rows += candle.expire(240)
+
+    expected = convert.tick_to_candle(tick, period='60')
+    live = pd.DataFrame(rows, columns=convert.CANDLE_COLUMNS)
+    assert np.allclose(live.values.astype(float), expected.values.astype(float))
+
+
+def test_parallel_json_aliases(tmp_path, monkeypatch):
+    src = tmp_path / 'tick.json'
+    src.write_text('{"id": 1, "price": "10.5", "amount": "1", "time": "60"}\n'
+                   '{"id": 2, "price": "11.0", "amount": "2", "time": "61"}\n')
+
+    monkeypatch.setattr(convert, '_PARALLEL_JSON_BYTES', 0)
+    tick = convert.read_data(str(src), 'tick', 'json', usecols='price,timestamp', jobs=2)
+    assert list(tick.columns) == ['price', 'timestamp']
+    assert list(tick.timestamp) == [60, 61]
+
+
+def test_batch_data(tmp_path):
+    from datetime import datetime, timedelta
+    from datasink import Datasink
+
+    root = str(tmp_path / 'tick')
+    tick = make_ticks()
+
+    # Two partitions named by their opening time
+    for part in (tick.iloc[:3], tick.iloc[3:]):
+        sink = Datasink(root, header='id,price,amount,time', namemode=1,
+                        resolution=Datasink.MINUTE)
+        for row in part.itertuples():
+            sink.write('{},{},{},{}'.format(row.Index, row.price, row.amount, row.timestamp))
+        sink.close()
+        time.sleep(1)
+
+    now  = datetime.now()
+    args = (root, now - timedelta(minutes=2), now + timedelta(minutes=2), 'tick', 'candle', 'csv')
+    candle = convert.batch_data(*args, namemode=1, jobs=2, period='60')
+    expected = convert.tick_to_candle(tick, period='60')
+    assert np.allclose(candle.values.astype(float), expected.values.astype(float))
+
+    empty = (root, now - timedelta(days=2), now - timedelta(days=1), 'tick', 'candle', 'csv')
+    with pytest.raises(FileNotFoundError):
+        convert.batch_data(*empty, namemode=1, period='60')
+
+
+def test_result_cache_keys(tmp_path):
+    src = tmp_path / 'tick.csv'
+    make_ticks().to_csv(src, index=False)
+    cache = convert.ResultCache(str(tmp_path / 'cache'), min_age=0)
+
+    key = cache.key(str(src), 'convert', {'period': '60', 'header': 'a,b'})
+    assert key == cache.key(str(src), 'convert', {'header': 'a,b', 'period': '60', 'jobs': '4'})
+    assert key != cache.key(str(src), 'convert', {'period': '120', 'header': 'a,b'})
+
+    # Unreadable entries are misses
+    (tmp_path / 'cache' / (key + cache.SUFFIX)).write_bytes(b'not a pickle')
+    assert cache.get(key) is None
+
+
+def test_diff_to_book_snapshot(tmp_path):
+    import json
+
+    # Levels may carry an order id after price and amount
+    snapshot = {'timestamp': '0', 'microtimestamp': '50',
+                'bids': [['99.0', '1.0', '11'], ['98.0', '2.0', '12']],
+                'asks': [['102.0', '3.0', '13']]}
+    path = tmp_path / 'book.json'
+    path.write_text(json.dumps(snapshot) + '\n')
+
+    book = convert.diff_to_book(make_diffs(), snapshot=str(path), interval=1, depth=2)
+    first = book.iloc[0]
+    assert (first.bid_price_0, first.bid_price_1) == (100.0, 99.0)
+    assert (first.ask_price_0, first.ask_price_1) == (101.0, 102.0)